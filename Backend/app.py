@@ -2,19 +2,26 @@ import os
 import json
 os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'  # Suppress oneDNN custom operations logs
 
-import shutil
-import sqlite3
+import asyncio
+import multiprocessing
+import threading
+import time
 import uvicorn
 import io
-import numpy as np
-import librosa
+import tarfile
+import zipfile
+from typing import List
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import soundfile as sf
-import tensorflow as tf
-import speech_recognition as sr
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks, Form
+from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks, Form, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from collections import defaultdict
-from fingerprint_engine import FingerprintEngine
+from fastapi.responses import JSONResponse, StreamingResponse
+from audio_features import SAMPLE_RATE, DURATION_SECONDS, AudioContext, AudioDecodeError, preprocess_waveform, shared_features, worker_ready
+from fingerprint_index import IndexHolder
+from live_audio import LiveAudioStream
+from inference_batcher import InferenceBatcher, MicroBatcher, batch_buckets
+from result_cache import ResultCache, cache_key
 
 app = FastAPI()
 
@@ -28,110 +35,253 @@ app.add_middleware(
 )
 
 DB_PATH = "fingerprints.db"
-TEMP_DIR = "temp_uploads"
+INDEX_PATH = "fingerprints.idx"  # Memory-mapped index exported by scripts/db_tools.py
 DATASET_DIR = "Dataset"
 MODEL_PATH = os.path.join(DATASET_DIR, 'hybrid_audio_text_model_v6.keras')
 
-# Audio Processing Constants
-SAMPLE_RATE = 22050
-DURATION_SECONDS = 15
-N_MELS = 128
-FIXED_LENGTH = SAMPLE_RATE * DURATION_SECONDS
+# Uploads longer than this are fingerprinted with the streaming engine
+STREAM_MIN_SECONDS = 120
 
-if not os.path.exists(TEMP_DIR):
-    os.makedirs(TEMP_DIR)
+# Fingerprint matching: a file matches when this share of the query's IDF weight lines up
+# at one time offset. Matching stops as soon as the best candidate is past the bound.
+THRESHOLD_RATIO = 0.20
+# Streamed uploads have no known total; stop once this many hashes are aligned
+STREAM_STOP_ALIGNED = 500
+
+# Auto mode runs stage 2 alongside stage 1, but holds back its (billed) Google
+# transcription until stage 1 has found no known fraud, or for at most this many seconds
+SPECULATIVE_TRANSCRIBE_DELAY = float(os.environ.get("SPECULATIVE_TRANSCRIBE_DELAY", 1.0))
+
+# Result cache: identical uploads (same bytes, mode and transcript) are answered without
+# re-running either stage. Set RESULT_CACHE_DB to keep results across restarts.
+RESULT_CACHE_ENTRIES = 1024
+RESULT_CACHE_TTL_SECONDS = 24 * 3600
+RESULT_CACHE_DB = os.environ.get("RESULT_CACHE_DB")
+
+# Executors that keep blocking work off the event loop: threads for file I/O, index
+# matching, transcription and model calls; processes for librosa/FFT feature extraction.
+IO_WORKERS = int(os.environ.get("IO_WORKERS", 8))
+CPU_WORKERS = int(os.environ.get("CPU_WORKERS", os.cpu_count() or 1))
+
+# Hybrid model micro-batching: concurrent requests share one forward pass of up to
+# INFERENCE_BATCH_SIZE inputs, waiting at most INFERENCE_MAX_WAIT_MS to fill it
+INFERENCE_BATCH_SIZE = int(os.environ.get("INFERENCE_BATCH_SIZE", 16))
+INFERENCE_MAX_WAIT_MS = float(os.environ.get("INFERENCE_MAX_WAIT_MS", 10))
+# Set SERVING_XLA=1 to XLA-compile the serving function
+SERVING_XLA = os.environ.get("SERVING_XLA", "0") == "1"
+
+# /predict/batch: recordings analysed concurrently per request, and stage 1 lookups of
+# up to MATCH_BATCH_SIZE recordings combined into one index query
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", 32))
+MATCH_BATCH_SIZE = 64
+MATCH_MAX_WAIT_MS = 5
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.flac', '.ogg')
+
+# /ws/live: live-call analysis. Received audio is fingerprinted every LIVE_STEP_SECONDS
+# and the last LIVE_MATCH_SECONDS are matched against the index; every
+# LIVE_HYBRID_HOP_SECONDS the hybrid model scores the last DURATION_SECONDS.
+# A verdict is pushed as soon as a stage is confident.
+LIVE_STEP_SECONDS = 1.0
+LIVE_MATCH_SECONDS = 30.0
+LIVE_MIN_MATCH_SECONDS = 3.0  # shorter buffers can line up by chance
+LIVE_HYBRID_HOP_SECONDS = 5.0
+LIVE_HYBRID_THRESHOLD = float(os.environ.get("LIVE_HYBRID_THRESHOLD", 0.8))
+LIVE_MAX_CHUNK_BYTES = 1 << 20
+
+# Hybrid model backend: "keras", or "tflite" for the quantized models written by
+# scripts/export_tflite.py (TFLITE_QUANTIZATION: float16 or int8)
+INFERENCE_BACKEND = os.environ.get("INFERENCE_BACKEND", "keras")
+TFLITE_QUANTIZATION = os.environ.get("TFLITE_QUANTIZATION", "float16")
+TFLITE_MODEL_PATH = os.path.join(DATASET_DIR, f'hybrid_audio_text_model_v6.{TFLITE_QUANTIZATION}.tflite')
+TFLITE_TOKENIZER_PATH = os.path.join(DATASET_DIR, 'hybrid_audio_text_model_v6.tokenizer.json')
+SERVED_MODEL_PATH = TFLITE_MODEL_PATH if INFERENCE_BACKEND == "tflite" else MODEL_PATH
+
+# Stage 1 index backend: "memory" (index file or DB loaded into memory), or "sqlite" to
+# query DB_PATH directly through a pool of SQLITE_POOL_SIZE read-only connections
+FINGERPRINT_BACKEND = os.environ.get("FINGERPRINT_BACKEND", "memory")
+SQLITE_POOL_SIZE = int(os.environ.get("SQLITE_POOL_SIZE", IO_WORKERS))
 
 # Initialize Engines
-print("Initializing Fingerprint Engine...")
-fingerprint_engine = FingerprintEngine()
-
-print(f"Loading Hybrid AI Model from {MODEL_PATH}...")
-try:
-    hybrid_model = tf.keras.models.load_model(MODEL_PATH)
-    print("Hybrid AI Model loaded successfully!")
-except Exception as e:
-    print(f"WARNING: Failed to load Hybrid AI Model: {e}")
-    hybrid_model = None
-
-FILE_SCAM_MAP = {}
-
-def load_scam_types():
-    """Scans the Dataset directory to map filenames to scam types, or loads from JSON."""
-    global FILE_SCAM_MAP
-    print("Loading scam types...")
-    
-    mapping_file = 'scam_mapping.json'
-    if os.path.exists(mapping_file):
+# The exported index file is memory-mapped so all uvicorn workers share one copy in the
+# page cache; without it the SQLite DB is loaded into memory. SQLite stays the source of
+# truth and the index is reloaded whenever the file changes.
+fingerprint_index = IndexHolder(DB_PATH, INDEX_PATH, FINGERPRINT_BACKEND, SQLITE_POOL_SIZE)
+
+io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="predict-io")
+# Spawned (not forked) so the workers never inherit TensorFlow's threads or model memory;
+# they only import the feature modules
+cpu_executor = ProcessPoolExecutor(max_workers=CPU_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+# The hybrid model is loaded in the background after startup: importing TensorFlow takes
+# seconds, and fingerprint requests are served without it in the meantime
+hybrid_model = None
+model_server = None
+model_loading = None  # Future of load_hybrid_model()
+model_degraded_reason = None  # why hybrid predictions are unavailable or not on the serving path
+model_loading_lock = threading.Lock()
+
+def load_hybrid_model():
+    """Imports the inference backend, loads the hybrid model and warms it up."""
+    global hybrid_model, model_server, model_degraded_reason
+    start = time.time()
+    if INFERENCE_BACKEND == "tflite":
+        print(f"Loading TFLite Hybrid Model from {TFLITE_MODEL_PATH}...")
         try:
-            with open(mapping_file, 'r') as f:
-                FILE_SCAM_MAP.update(json.load(f))
-            print(f"Loaded {len(FILE_SCAM_MAP)} file-to-scam mappings from {mapping_file}.")
-            return
+            from tflite_serving import TFLiteHybridModel
+            model_server = TFLiteHybridModel(TFLITE_MODEL_PATH, TFLITE_TOKENIZER_PATH, batch_buckets(INFERENCE_BATCH_SIZE))
+            print("TFLite Hybrid Model loaded successfully!")
+        except Exception as e:
+            print(f"WARNING: Failed to load TFLite Hybrid Model: {e}")
+            model_degraded_reason = f"hybrid model failed to load ({e}); serving fingerprint matching only"
+    else:
+        print(f"Loading Hybrid AI Model from {MODEL_PATH}...")
+        try:
+            import tensorflow as tf
+            model = tf.keras.models.load_model(MODEL_PATH)
+            print("Hybrid AI Model loaded successfully!")
         except Exception as e:
-            print(f"Error loading {mapping_file}: {e}")
-
-    count = 0
-    if os.path.exists(DATASET_DIR):
-        for root, dirs, files in os.walk(DATASET_DIR):
-            folder_name = os.path.basename(root)
-            if folder_name == "Dataset": continue
-            
-            for file in files:
-                if file.lower().endswith(('.mp3', '.wav')):
-                    FILE_SCAM_MAP[file] = folder_name
-                    count += 1
-    print(f"Loaded {count} file-to-scam mappings via directory scan.")
-
-# Load scam types on startup
-load_scam_types()
-
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+            print(f"WARNING: Failed to load Hybrid AI Model: {e}")
+            model_degraded_reason = f"hybrid model failed to load ({e}); serving fingerprint matching only"
+            model = None
 
-# --- Hybrid Model Helper Functions ---
+        # Served through a fixed-signature tf.function, warmed up for every batch size the
+        # inference batcher can produce before /ready reports healthy
+        if model:
+            try:
+                from model_serving import HybridModelServer
+                model_server = HybridModelServer(model, batch_buckets(INFERENCE_BATCH_SIZE), jit_compile=SERVING_XLA)
+            except Exception as e:
+                print(f"WARNING: Failed to build the serving function, using Keras predict: {e}")
+                model_degraded_reason = f"serving function unavailable ({e}); using Keras predict"
+        hybrid_model = model
+
+    if model_server is not None:
+        model_server.warmup()
+        if not model_server.ready:
+            # A server that failed its warm-up is not used: predictions fall back to Keras
+            # predict, or to fingerprint matching only when there is no Keras model
+            if hybrid_model:
+                model_degraded_reason = f"serving warm-up failed ({model_server.error}); using Keras predict"
+            else:
+                model_degraded_reason = f"serving warm-up failed ({model_server.error}); serving fingerprint matching only"
+            model_server = None
+    print(f"Hybrid model available after {time.time() - start:.2f} seconds.")
+
+def start_model_loading():
+    """Starts loading the hybrid model once; returns the loading Future."""
+    global model_loading
+    with model_loading_lock:
+        if model_loading is None:
+            model_loading = io_executor.submit(load_hybrid_model)
+        return model_loading
+
+@app.on_event("startup")
+def start_background_loading():
+    # Nothing heavy runs at import: the index, the worker processes and the model are
+    # loaded in the background, in the order the stages need them
+    io_executor.submit(fingerprint_index.get)
+    for _ in range(CPU_WORKERS):
+        cpu_executor.submit(worker_ready)
+    start_model_loading()
+
+@app.on_event("shutdown")
+def shutdown_executors():
+    cpu_executor.shutdown(cancel_futures=True)
+    io_executor.shutdown(cancel_futures=True)
 
-def preprocess_audio(audio_path):
-    """Preprocesses audio for the Hybrid Model (Mel-spectrogram)."""
+async def run_blocking(executor, func, *args):
+    return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+def predict_batch(audio_batch, transcripts):
+    """One forward pass of the hybrid model; returns a score per input."""
+    if model_server is not None:
+        return model_server.predict(audio_batch, transcripts)
+    import tensorflow as tf
+    prediction = hybrid_model.predict([audio_batch, tf.constant(transcripts)], batch_size=len(transcripts), verbose=0)
+    return prediction[:, 0]
+
+inference_batcher = InferenceBatcher(predict_batch, INFERENCE_BATCH_SIZE, INFERENCE_MAX_WAIT_MS, io_executor)
+
+def match_queries(queries):
+    """Stage 1 lookups of several uploads as one combined index query per index version."""
+    sessions = [None] * len(queries)
+    by_index = {}
+    for i, (index, hashes, offsets, stop_weight) in enumerate(queries):
+        by_index.setdefault(id(index), (index, []))[1].append(i)
+    for index, positions in by_index.values():
+        batch = [queries[i][1:3] for i in positions]
+        stop_weights = [queries[i][3] for i in positions]
+        for i, session in zip(positions, index.match_many(batch, stop_weights)):
+            sessions[i] = session
+    return sessions
+
+match_batcher = MicroBatcher(match_queries, MATCH_BATCH_SIZE, MATCH_MAX_WAIT_MS, io_executor)
+
+result_cache = ResultCache(RESULT_CACHE_ENTRIES, RESULT_CACHE_TTL_SECONDS, RESULT_CACHE_DB)
+
+def results_version():
+    """Cached results are only valid for the fingerprint index and model they were computed with."""
     try:
-        y, native_sr = sf.read(audio_path)
-        
-        if y.ndim > 1:
-            y = np.mean(y, axis=1)
-            
-        if native_sr != SAMPLE_RATE:
-            y = librosa.resample(y, orig_sr=native_sr, target_sr=SAMPLE_RATE)
-            
-        max_len = SAMPLE_RATE * DURATION_SECONDS
-        if len(y) > max_len:
-             y = y[:max_len]
-             
-        y = librosa.util.normalize(y)
+        model_stat = os.stat(SERVED_MODEL_PATH)
+        model_version = f"{model_stat.st_mtime_ns}:{model_stat.st_size}"
+    except OSError:
+        model_version = "none"
+    loaded = "loaded" if model_server is not None or hybrid_model else "missing"
+    return f"{fingerprint_index.version}|{SERVED_MODEL_PATH}@{model_version}:{loaded}"
 
-        if len(y) < FIXED_LENGTH:
-            y = np.pad(y, (0, int(FIXED_LENGTH - len(y))), mode='constant')
-        else:
-            y = y[:int(FIXED_LENGTH)]
+def is_cacheable(result):
+    """Errors and results built on a failed transcription are recomputed next time."""
+    return result.get("label") != "ERROR" and result.get("transcript", None) != ""
 
-        spectrogram = librosa.feature.melspectrogram(y=y, sr=SAMPLE_RATE, n_mels=N_MELS)
-        
-        max_val = np.max(spectrogram)
-        if max_val == 0: max_val = 1e-9
-        log_spectrogram = librosa.power_to_db(spectrogram, ref=max_val)
+def should_stream(audio):
+    """Recordings longer than STREAM_MIN_SECONDS are fingerprinted in bounded memory."""
+    return audio.duration > STREAM_MIN_SECONDS
 
-        # Reshape for model input (batch_size, height, width, channels)
-        result = np.expand_dims(np.expand_dims(log_spectrogram, axis=-1), axis=0)
-        return result
-    except Exception as e:
-        print(f"Error in preprocess_audio: {e}")
-        return None
+def decoded_samples(audio):
+    """Mono samples at SAMPLE_RATE; decodes the upload on first use."""
+    return audio.samples
+
+def hybrid_samples(audio):
+    """The first DURATION_SECONDS at SAMPLE_RATE, all the hybrid model reads of an upload."""
+    return audio.head(DURATION_SECONDS)
+
+def match_blocks(index, blocks, session):
+    """Feeds fingerprint blocks to a MatchSession until it stops. Returns (hash count, query weight)."""
+    total_hashes = 0
+    total_weight = 0.0
+    for hashes, offsets in blocks:
+        total_hashes += len(hashes)
+        total_weight += index.query_weight(hashes)
+        if session.add(hashes, offsets):
+            break
+    return total_hashes, total_weight
+
+def match_stream(fingerprint_engine, index, audio):
+    # Long recordings are matched block by block while they are still being decoded;
+    # the total is unknown, so matching stops on an absolute aligned count
+    session = index.session(stop_hits=STREAM_STOP_ALIGNED)
+    total_hashes, total_weight = match_blocks(index, fingerprint_engine.fingerprint_stream(audio.open()), session)
+    return session, total_hashes, total_weight
 
-def transcribe_audio(audio_path):
-    """Transcribes audio using Google Speech Recognition."""
+def live_step(fingerprint_engine, index, live, last=False):
+    """Fingerprints a live call's new audio and matches its sliding buffer; returns the stage 1 response."""
+    live.fingerprint(last)
+    blocks = list(live.blocks)
+    weights = [index.query_weight(hashes) for hashes, _ in blocks]
+    session = index.session(stop_weight=THRESHOLD_RATIO * sum(weights))
+    for hashes, offsets in blocks:
+        if session.add(hashes, offsets):
+            break
+    return fingerprint_result(fingerprint_engine, session, sum(len(hashes) for hashes, _ in blocks), sum(weights))
+
+# --- Hybrid Model Helper Functions ---
+
+def transcribe_audio(audio):
+    """Transcribes an AudioContext using Google Speech Recognition."""
+    import speech_recognition as sr
     recognizer = sr.Recognizer()
     try:
-        y, sr_native = sf.read(audio_path)
+        y, sr_native = audio.native
         # Convert to WAV in memory for SpeechRecognition
         wav_io = io.BytesIO()
         sf.write(wav_io, y, sr_native, format='WAV')
@@ -147,149 +297,468 @@ def transcribe_audio(audio_path):
         traceback.print_exc()
         return ""
 
+async def timed(coro, timings, name):
+    """Awaits a stage and records its wall time (seconds) and outcome in timings[name]."""
+    start = time.perf_counter()
+    status = "failed"
+    try:
+        result = await coro
+        status = "completed"
+        return result
+    except asyncio.CancelledError:
+        status = "cancelled"
+        raise
+    finally:
+        timings[name] = {"status": status, "seconds": round(time.perf_counter() - start, 4)}
+
+async def stage_features(audio, fingerprint_engine, with_mel):
+    """One STFT serves the fingerprint and, when asked, the hybrid model's mel input."""
+    samples = await run_blocking(io_executor, decoded_samples, audio)
+    return await run_blocking(cpu_executor, shared_features, fingerprint_engine, samples, with_mel)
+
+async def hybrid_features(audio, features=None):
+    if features is not None:
+        try:
+            _, _, mel_input = await asyncio.shield(features)
+            if mel_input is not None:
+                return mel_input
+        except Exception:
+            pass  # Stage 1 reports its own failure; compute the mel input separately
+    # Streamed uploads are never decoded in full; the model only needs the head
+    samples = await run_blocking(io_executor, hybrid_samples, audio)
+    return await run_blocking(cpu_executor, preprocess_waveform, samples)
+
+async def fingerprint_stage(audio, fingerprint_engine, index, features, combined=False):
+    """
+    Stage 1: matches the upload against the fingerprint index.
+    Returns a KNOWN_FRAUD response, or a LEGIT one when nothing matches.
+    features is the stage_features task, or None to stream long uploads.
+    combined=True shares one index query with other recordings being matched.
+    """
+    print("Stage 1: Running Fingerprint Analysis...")
+    if features is None:
+        session, total_input_hashes, total_weight = await run_blocking(
+            io_executor, match_stream, fingerprint_engine, index, audio)
+    elif combined:
+        hashes, offsets, _ = await features
+        total_input_hashes, total_weight = len(hashes), index.query_weight(hashes)
+        session = await match_batcher.submit(index, hashes, offsets, THRESHOLD_RATIO * total_weight)
+    else:
+        hashes, offsets, _ = await features
+        blocks = [(hashes, offsets)]
+        session = index.session(stop_weight=THRESHOLD_RATIO * index.query_weight(hashes))
+        total_input_hashes, total_weight = await run_blocking(io_executor, match_blocks, index, blocks, session)
+
+    return fingerprint_result(fingerprint_engine, session, total_input_hashes, total_weight)
+
+def fingerprint_result(fingerprint_engine, session, total_input_hashes, total_weight):
+    """The stage 1 response for a finished MatchSession over total_input_hashes query hashes."""
+    match_ratio = 0.0
+    scam_type = "Unknown"
+    fingerprint_confidence = 0.0
+    best_match_file = None
+
+    if total_input_hashes:
+        best_file_id, match_count, match_weight, match_offset = session.best()
+        if best_file_id is not None:
+             best_match_file, best_scam_type = session.index.file_info(best_file_id)
+             # Share of the (IDF-weighted, stop-pruned) query that lines up with the best file
+             match_ratio = match_weight / total_weight if total_weight > 0 else 0
+             fingerprint_confidence = 1.0 if session.stopped else min(match_ratio / THRESHOLD_RATIO, 1.0)
+             
+             if match_ratio >= THRESHOLD_RATIO or session.stopped:
+                 scam_type = best_scam_type or "Unknown Scam"
+                 return {
+                    "label": "KNOWN_FRAUD",
+                    "confidence": fingerprint_confidence,
+                    "scam_type": scam_type,
+                    "match_ratio": match_ratio,
+                    "best_match": best_match_file,
+                    "aligned_hashes": match_count,
+                    "hashes_queried": session.hashes_queried,
+                    "hashes_pruned": session.hashes_pruned,
+                    "match_offset_seconds": match_offset * fingerprint_engine.hop_length / fingerprint_engine.sampling_rate,
+                    "details": f"Fingerprint Match ({match_ratio:.1%}) with {best_match_file}"
+                }
+
+    return {
+        "label": "LEGIT", 
+        "confidence": 0.0, 
+        "details": "No significant fingerprint match found.",
+        "match_ratio": match_ratio,
+        "best_match": best_match_file
+    }
+
+async def hybrid_stage(audio, manual_transcript, features=None, transcribe_gate=None):
+    """
+    Stage 2: scores the transcript and mel-spectrogram with the hybrid model.
+    A speculative run passes transcribe_gate, an asyncio.Event set once stage 1
+    has found no known fraud; transcription waits for it (at most
+    SPECULATIVE_TRANSCRIBE_DELAY seconds), so early stage 1 matches cost no API call.
+    """
+    print("Stage 2: Running Hybrid AI Analysis...")
+    # Requests that arrive while the model is still loading wait for it
+    await asyncio.wrap_future(start_model_loading())
+    if model_server is None and not hybrid_model:
+        return {"label": "LEGIT", "confidence": 0.0, "details": "Hybrid Model not loaded."}
+
+    # Preprocess Audio while the transcript is being generated
+    audio_task = asyncio.ensure_future(hybrid_features(audio, features))
+    try:
+        # Use manual transcript if provided, otherwise transcribe
+        if manual_transcript:
+            print("Using Manual Transcript")
+            transcript = manual_transcript
+        else:
+            if transcribe_gate is not None:
+                try:
+                    await asyncio.wait_for(transcribe_gate.wait(), SPECULATIVE_TRANSCRIBE_DELAY)
+                except asyncio.TimeoutError:
+                    pass
+            print("Generating Transcript...")
+            transcript = await run_blocking(io_executor, transcribe_audio, audio)
+        
+        if not transcript: transcript = "" 
+        
+        audio_input = await audio_task
+    finally:
+        audio_task.cancel()
+    
+    if audio_input is None:
+        return {"label": "LEGIT", "confidence": 0.0, "details": "Audio preprocessing failed for AI model."}
+
+    ai_score = await inference_batcher.predict(audio_input, transcript)
+    
+    print(f"Hybrid Model Score: {ai_score}")
+    
+    hybrid_result = {
+        "confidence": ai_score,
+        "transcript": transcript,
+        "model_version": "v7", # Assuming v7 based on code
+        "details": f"AI Score: {ai_score:.4f}"
+    }
+
+    if ai_score > 0.5:
+         hybrid_result.update({
+            "label": "SUSPECTED_FRAUD",
+            "scam_type": "AI Detected Pattern",
+        })
+    else:
+        hybrid_result.update({
+            "label": "LEGIT",
+        })
+    return hybrid_result
+
+def discard_result(task):
+    # Marks a failure of speculative work as seen when stage 1 answered without it
+    if not task.cancelled():
+        task.exception()
+
+async def run_prediction(audio, mode, manual_transcript, batch=False):
+    """
+    Runs the fingerprint and/or hybrid stages on a decoded upload and returns the response.
+    In auto mode stage 2 starts speculatively alongside stage 1 and is cancelled
+    as soon as stage 1 finds a known fraud, so unmatched calls wait for the slower
+    stage rather than both. Its transcription is held back until stage 1 has
+    answered or SPECULATIVE_TRANSCRIBE_DELAY has passed. The response's "stages" entry reports what ran and for how long.
+    With batch=True (/predict/batch) stage 1 lookups are combined with other
+    uploads' and stage 2 only runs when needed, since throughput matters more there.
+    """
+    timings = {}
+    if mode == "hybrid":
+        result = await timed(hybrid_stage(audio, manual_transcript), timings, "hybrid")
+        return {**result, "stages": timings}
+    if mode not in ["auto", "fingerprint"]:
+        return {"label": "ERROR", "details": "No result computed"}
+
+    fingerprint_engine, index = await run_blocking(io_executor, fingerprint_index.get)
+    features = None
+    if not await run_blocking(io_executor, should_stream, audio):
+        features = asyncio.ensure_future(stage_features(audio, fingerprint_engine, mode == "auto"))
+
+    hybrid_task = None
+    if mode == "auto" and batch:
+        result = await timed(fingerprint_stage(audio, fingerprint_engine, index, features, combined=True), timings, "fingerprint")
+        if result["label"] != "KNOWN_FRAUD":
+            result = await timed(hybrid_stage(audio, manual_transcript, features), timings, "hybrid")
+        return {**result, "stages": timings}
+    if mode == "auto":
+        transcribe_gate = asyncio.Event()
+        hybrid_task = asyncio.ensure_future(timed(hybrid_stage(audio, manual_transcript, features, transcribe_gate), timings, "hybrid"))
+        hybrid_task.add_done_callback(discard_result)
+    try:
+        result = await timed(fingerprint_stage(audio, fingerprint_engine, index, features, combined=batch), timings, "fingerprint")
+        if hybrid_task is not None and result["label"] != "KNOWN_FRAUD":
+            transcribe_gate.set()
+            result = await hybrid_task
+    finally:
+        if hybrid_task is not None and not hybrid_task.done():
+            hybrid_task.cancel()
+            # Let the cancellation land so it shows up in the timings
+            await asyncio.wait([hybrid_task])
+    return {**result, "stages": timings}
+
 @app.post("/predict")
 async def predict(
     file: UploadFile = File(...),
     mode: str = Form("auto"),
     manual_transcript: str = Form(None)
 ):
-    temp_file_path = os.path.join(TEMP_DIR, file.filename)
-    try:
-        with open(temp_file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        results = {}
-        
-        # --- STAGE 1: FINGERPRINT CHECK ---
-        if mode in ["auto", "fingerprint"]:
-            print("Stage 1: Running Fingerprint Analysis...")
-            hashes = fingerprint_engine.fingerprint_file(temp_file_path)
-            
-            match_ratio = 0.0
-            scam_type = "Unknown"
-            fingerprint_confidence = 0.0
-            best_match_file = None
-            
-            if hashes:
-                conn = get_db_connection()
-                cursor = conn.cursor()
-                query_hashes = [h[0] for h in hashes]
-                chunk_size = 500
-                matches = defaultdict(int)
-                
-                for i in range(0, len(query_hashes), chunk_size):
-                    chunk = query_hashes[i:i+chunk_size]
-                    placeholders = ','.join(['?'] * len(chunk))
-                    sql = f"SELECT file_name FROM fingerprints WHERE hash IN ({placeholders})"
-                    cursor.execute(sql, chunk)
-                    rows = cursor.fetchall()
-                    for row in rows:
-                        matches[row['file_name']] += 1
-                conn.close()
-
-                if matches:
-                     best_match_file = max(matches, key=matches.get)
-                     match_count = matches[best_match_file]
-                     total_input_hashes = len(hashes)
-                     match_ratio = match_count / total_input_hashes if total_input_hashes > 0 else 0
-                     
-                     # Dynamic Threshold
-                     THRESHOLD_RATIO = 0.20
-                     fingerprint_confidence = min(match_ratio / THRESHOLD_RATIO, 1.0)
-                     
-                     if match_ratio >= THRESHOLD_RATIO:
-                         scam_type = FILE_SCAM_MAP.get(best_match_file, "Unknown Scam")
-                         results["fingerprint"] = {
-                            "label": "KNOWN_FRAUD",
-                            "confidence": fingerprint_confidence,
-                            "scam_type": scam_type,
-                            "match_ratio": match_ratio,
-                            "best_match": best_match_file,
-                            "details": f"Fingerprint Match ({match_ratio:.1%}) with {best_match_file}"
-                        }
-                         # If mode is auto, we can return early if we found a strong match
-                         if mode == "auto":
-                             return results["fingerprint"]
-
-            if "fingerprint" not in results and mode == "fingerprint":
-                 return {
-                    "label": "LEGIT", 
-                    "confidence": 0.0, 
-                    "details": "No significant fingerprint match found.",
-                    "match_ratio": match_ratio,
-                    "best_match": best_match_file
-                }
+    data = await file.read()
+    # Hashing the upload and the SQLite cache tier block, so they run off the event loop
+    version = results_version()
+    result_cache.set_version(version)
+    key = await run_in_threadpool(cache_key, data, mode, manual_transcript or "")
+    cached = await run_in_threadpool(result_cache.get, key)
+    if cached is not None:
+        print(f"Result cache hit for {file.filename}.")
+        return {**cached, "cached": True}
 
+    try:
+        # Decoded once in memory and shared by both stages
+        audio = AudioContext(data, file.filename)
+        result = await run_prediction(audio, mode, manual_transcript)
+        if is_cacheable(result):
+            await run_in_threadpool(result_cache.put, key, result, version)
+        return result
 
-        # --- STAGE 2: HYBRID AI MODEL ---
-        if mode in ["auto", "hybrid"]:
-            # If auto mode and we already found a fraud in stage 1, we might skip this 
-            # (matches original logic, but user might want 'Deep Scan' to always run if requested)
-            if mode == "auto" and "fingerprint" in results:
-                 pass # Already returned above
-            
-            print("Stage 2: Running Hybrid AI Analysis...")
-            if hybrid_model:
-                # Use manual transcript if provided, otherwise transcribe
-                if manual_transcript:
-                    print("Using Manual Transcript")
-                    transcript = manual_transcript
-                else:
-                    print("Generating Transcript...")
-                    transcript = transcribe_audio(temp_file_path)
-                
-                if not transcript: transcript = "" 
-                
-                # Preprocess Audio
-                audio_input = preprocess_audio(temp_file_path)
-                
-                if audio_input is not None:
-                    text_input = tf.constant([transcript])
-                    prediction = hybrid_model.predict([audio_input, text_input])
-                    ai_score = float(prediction[0][0])
-                    
-                    print(f"Hybrid Model Score: {ai_score}")
-                    
-                    hybrid_result = {
-                        "confidence": ai_score,
-                        "transcript": transcript,
-                        "model_version": "v7", # Assuming v7 based on code
-                        "details": f"AI Score: {ai_score:.4f}"
-                    }
-
-                    if ai_score > 0.5:
-                         hybrid_result.update({
-                            "label": "SUSPECTED_FRAUD",
-                            "scam_type": "AI Detected Pattern",
-                        })
-                    else:
-                        hybrid_result.update({
-                            "label": "LEGIT",
-                        })
-                    
-                    if mode == "hybrid":
-                        return hybrid_result
-                    
-                    # For auto mode, if we are here, it means stage 1 failed or didn't find fraud
-                    return hybrid_result
-
-                else:
-                     return {"label": "LEGIT", "confidence": 0.0, "details": "Audio preprocessing failed for AI model."}
-            else:
-                 return {"label": "LEGIT", "confidence": 0.0, "details": "Hybrid Model not loaded."}
-                 
-        return results.get("fingerprint", {"label": "ERROR", "details": "No result computed"})
-
+    except AudioDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error processing file: {e}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
+
+def expand_uploads(uploads):
+    """(name, bytes) of every recording in the uploads; .zip and .tar(.gz) archives are unpacked."""
+    for name, data in uploads:
+        lower = (name or "").lower()
+        if lower.endswith('.zip'):
+            with zipfile.ZipFile(io.BytesIO(data)) as archive:
+                for member in archive.infolist():
+                    if not member.is_dir() and member.filename.lower().endswith(AUDIO_EXTENSIONS):
+                        yield member.filename, archive.read(member)
+        elif lower.endswith(('.tar', '.tar.gz', '.tgz')):
+            with tarfile.open(fileobj=io.BytesIO(data)) as archive:
+                for member in archive:
+                    if member.isfile() and member.name.lower().endswith(AUDIO_EXTENSIONS):
+                        yield member.name, archive.extractfile(member).read()
+        else:
+            yield name, data
+
+@app.post("/predict/batch")
+async def predict_batch_endpoint(
+    files: List[UploadFile] = File(...),
+    mode: str = Form("auto")
+):
+    """
+    Analyses many recordings (or .zip / .tar archives of them) in one request.
+    Results are streamed as NDJSON, one line per recording in completion order;
+    each carries the recording's "file" name and upload "index".
+    """
+    uploads = [(file.filename, await file.read()) for file in files]
+    try:
+        recordings = list(expand_uploads(uploads))
+    except (zipfile.BadZipFile, tarfile.TarError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid archive: {e}")
+    version = results_version()
+    result_cache.set_version(version)
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def analyze(position, name, data):
+        item = {"file": name, "index": position}
+        key = await run_in_threadpool(cache_key, data, mode, "")
+        cached = await run_in_threadpool(result_cache.get, key)
+        if cached is not None:
+            return {**item, **cached, "cached": True}
+        async with semaphore:
+            try:
+                result = await run_prediction(AudioContext(data, name), mode, None, batch=True)
+            except Exception as e:
+                print(f"Error processing {name}: {e}")
+                return {**item, "label": "ERROR", "details": str(e)}
+        if is_cacheable(result):
+            await run_in_threadpool(result_cache.put, key, result, version)
+        return {**item, **result}
+
+    async def stream():
+        tasks = [asyncio.ensure_future(analyze(i, name, data)) for i, (name, data) in enumerate(recordings)]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield json.dumps(await next_result) + "\n"
+        finally:
+            # The client disconnected or the stream was closed early
+            for task in tasks:
+                task.cancel()
+
+    print(f"Batch of {len(recordings)} recordings ({mode} mode).")
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+LABEL_SEVERITY = {"LEGIT": 0, "SUSPECTED_FRAUD": 1, "KNOWN_FRAUD": 2}
+
+@app.websocket("/ws/live")
+async def live_call(websocket: WebSocket):
+    """
+    Analyses a call while it is happening.
+    The client may first send {"type": "start", "encoding": "pcm_s16le" | "pcm_f32le" | "encoded",
+    "sample_rate": 16000, "channels": 1, "transcript": null} as text (the defaults are
+    mono pcm_s16le at SAMPLE_RATE), then streams audio chunks as binary messages and
+    finishes with {"type": "end"}. The server sends "progress" after every fingerprint
+    step, "window" for every hybrid model window, "verdict" as soon as a stage flags
+    the call, and "final" once the call has ended.
+    """
+    await websocket.accept()
+    fingerprint_engine, index = await run_blocking(io_executor, fingerprint_index.get)
+    send_lock = asyncio.Lock()
+    live = None
+    transcript = None
+    match_result = None
+    hybrid_result = None
+    hybrid_task = None
+    hybrid_at = 0.0  # call time of the last hybrid window
+    verdicts = set()
+
+    async def send(message):
+        async with send_lock:
+            await websocket.send_json(message)
+
+    async def report_verdict(stage, result):
+        if result["label"] in verdicts:
+            return
+        verdicts.add(result["label"])
+        print(f"Live call verdict after {live.seconds:.1f}s: {result['label']} ({stage})")
+        await send({"type": "verdict", "stage": stage, "seconds": round(live.seconds, 2), **result})
+
+    async def score_window(start, end, wav):
+        nonlocal hybrid_result
+        try:
+            result = await hybrid_stage(AudioContext(wav, "live window"), transcript)
+        except Exception as e:
+            print(f"Live hybrid window failed: {e}")
+            return
+        if hybrid_result is None or result["confidence"] >= hybrid_result["confidence"]:
+            hybrid_result = result
+        await send({"type": "window", "start": round(start, 2), "end": round(end, 2), "label": result["label"],
+                    "confidence": result["confidence"], "details": result["details"]})
+        if result["label"] == "SUSPECTED_FRAUD" and result["confidence"] >= LIVE_HYBRID_THRESHOLD:
+            await report_verdict("hybrid", result)
+
+    def start_window():
+        nonlocal hybrid_task, hybrid_at
+        hybrid_at = live.seconds
+        start = max(live.seconds - len(live.window) / SAMPLE_RATE, 0.0)
+        hybrid_task = asyncio.ensure_future(score_window(start, live.seconds, live.window_wav()))
+
+    async def analyse(last=False):
+        nonlocal match_result
+        match_result = await run_blocking(io_executor, live_step, fingerprint_engine, index, live, last)
+        if match_result["label"] == "KNOWN_FRAUD" and live.seconds >= LIVE_MIN_MATCH_SECONDS:
+            await report_verdict("fingerprint", match_result)
+        await send({"type": "progress", "seconds": round(live.seconds, 2),
+                    "match_ratio": match_result["match_ratio"], "best_match": match_result["best_match"]})
+        # A known recording settles it; otherwise score a new window unless one is still running
+        due = live.seconds - hybrid_at >= LIVE_HYBRID_HOP_SECONDS
+        if "KNOWN_FRAUD" not in verdicts and due and (hybrid_task is None or hybrid_task.done()):
+            start_window()
+
+    try:
+        ended = False
+        while not ended:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("text") is not None:
+                try:
+                    control = json.loads(message["text"])
+                    if control.get("type") == "start" and live is None:
+                        live = LiveAudioStream(fingerprint_engine, control.get("encoding", "pcm_s16le"),
+                                               int(control.get("sample_rate", SAMPLE_RATE)), int(control.get("channels", 1)),
+                                               LIVE_MATCH_SECONDS)
+                        transcript = control.get("transcript")
+                        await send({"type": "ready", "encoding": live.encoding, "sample_rate": live.sample_rate})
+                    ended = control.get("type") == "end"
+                except (ValueError, TypeError, AttributeError) as e:
+                    await send({"type": "error", "details": f"Invalid control message: {e}"})
+                    await websocket.close(code=1008)
+                    return
+                continue
+
+            data = message.get("bytes") or b""
+            if len(data) > LIVE_MAX_CHUNK_BYTES:
+                await send({"type": "error", "details": f"Audio chunks are limited to {LIVE_MAX_CHUNK_BYTES} bytes"})
+                await websocket.close(code=1009)
+                return
+            if live is None:
+                live = LiveAudioStream(fingerprint_engine, match_seconds=LIVE_MATCH_SECONDS)
+            try:
+                await run_blocking(io_executor, live.feed, data)
+            except Exception as e:
+                await send({"type": "error", "details": f"Could not decode audio chunk: {e}"})
+                continue
+            if live.pending_seconds >= LIVE_STEP_SECONDS:
+                await analyse()
+
+        if live is None:
+            await websocket.close()
+            return
+        await analyse(last=True)
+        if hybrid_task is not None:
+            await hybrid_task
+        # Score the audio the last window did not cover
+        if "KNOWN_FRAUD" not in verdicts and live.seconds > hybrid_at:
+            start_window()
+            await hybrid_task
+
+        results = [r for r in (match_result, hybrid_result) if r is not None]
+        label = max((r["label"] for r in results), key=LABEL_SEVERITY.get, default="LEGIT")
+        await send({"type": "final", "seconds": round(live.seconds, 2), "label": label,
+                    "fingerprint": match_result, "hybrid": hybrid_result})
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
     finally:
-        if os.path.exists(temp_file_path):
-             try:
-                os.remove(temp_file_path)
-             except: pass
+        if hybrid_task is not None and not hybrid_task.done():
+            hybrid_task.cancel()
+
+@app.get("/ready")
+async def ready():
+    """
+    Healthy once the fingerprint index is loaded and hybrid model loading has finished.
+    Fingerprint requests are already served while the model is loading. If the model
+    or its serving path failed, the service is ready but degraded, and says why.
+    """
+    model_loaded = model_loading is not None and model_loading.done()
+    if not model_loaded:
+        model_state = "loading"
+    elif model_server is not None:
+        model_state = model_server.info()
+    else:
+        model_state = "keras" if hybrid_model else "not loaded"
+    body = {
+        "ready": fingerprint_index.index is not None and model_loaded,
+        "degraded": model_loaded and model_degraded_reason is not None,
+        "reason": model_degraded_reason if model_loaded else None,
+        "fingerprint_index": fingerprint_index.index is not None,
+        "hybrid_model": model_state,
+    }
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters of the /predict result cache."""
+    return result_cache.info()
+
+@app.get("/fingerprint/stats")
+async def fingerprint_stats():
+    """The stage 1 index in use; for the sqlite backend, connection pool reuse and health metrics."""
+    _, index = await run_blocking(io_executor, fingerprint_index.get)
+    return {"version": fingerprint_index.version, **index.info()}
+
+@app.get("/batcher/stats")
+async def batcher_stats():
+    """Batch fill metrics of the hybrid model inference batcher and the stage 1 match batcher."""
+    return {**inference_batcher.info(), "match": match_batcher.info()}
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8002)
@@ -0,0 +1,212 @@
+import io
+import os
+import tempfile
+import threading
+from functools import lru_cache
+import numpy as np
+import librosa
+import soundfile as sf
+
+# Feature extraction for the hybrid model. Kept free of TensorFlow so it can run in
+# worker processes without loading the model there.
+
+SAMPLE_RATE = 22050
+DURATION_SECONDS = 15
+N_MELS = 128
+N_FFT = 2048  # librosa.feature.melspectrogram defaults, shared with the fingerprint engine
+HOP_LENGTH = 512
+FIXED_LENGTH = SAMPLE_RATE * DURATION_SECONDS
+N_FRAMES = 1 + FIXED_LENGTH // HOP_LENGTH
+
+class AudioDecodeError(ValueError):
+    """The upload is not audio that soundfile or librosa (audioread) can decode."""
+
+class AudioContext:
+    """
+    An uploaded recording, decoded once and shared by every /predict stage.
+    native: mono float32 samples at the file's own rate (transcription).
+    samples: mono float32 samples at SAMPLE_RATE (fingerprinting, mel features).
+    Both are decoded lazily from the upload bytes; containers libsndfile cannot
+    open fall back to librosa.load via a temporary file (audioread, which needs
+    ffmpeg for m4a/aac/webm). Uploads neither can decode raise AudioDecodeError.
+    """
+
+    def __init__(self, data: bytes, name: str = ""):
+        self.data = data
+        self.name = name
+        self._duration = None
+        self._native = None
+        self._decode_error = None
+        self._samples = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path: str) -> 'AudioContext':
+        with open(path, 'rb') as f:
+            return cls(f.read(), path)
+
+    def open(self) -> io.BytesIO:
+        """A fresh file object over the upload bytes (for streaming decoders)."""
+        return io.BytesIO(self.data)
+
+    @property
+    def duration(self) -> float:
+        """Duration in seconds read from the header, 0 if unknown."""
+        if self._duration is None:
+            try:
+                self._duration = sf.info(self.open()).duration
+            except Exception:
+                self._duration = 0.0
+        return self._duration
+
+    @property
+    def native(self):
+        """(samples, sampling rate) at the native rate. Raises AudioDecodeError."""
+        with self._lock:
+            if self._native is None and self._decode_error is None:
+                try:
+                    y, native_sr = sf.read(self.open(), dtype='float32', always_2d=True)
+                    self._native = (y.mean(axis=1), native_sr)
+                except Exception as e:
+                    try:
+                        self._native = self._decode_with_librosa()
+                    except Exception as fallback_error:
+                        print(f"Error decoding audio {self.name}: {e}; fallback: {fallback_error}")
+                        self._decode_error = AudioDecodeError(f"Cannot decode {self.name or 'upload'} as audio: {fallback_error}")
+            if self._decode_error is not None:
+                raise self._decode_error
+            return self._native
+
+    def _decode_with_librosa(self):
+        """
+        Decodes containers libsndfile cannot open (m4a/aac, some webm) through librosa's
+        audioread fallback, which needs a file on disk.
+        """
+        suffix = os.path.splitext(self.name)[1]
+        with tempfile.NamedTemporaryFile(suffix=suffix) as f:
+            f.write(self.data)
+            f.flush()
+            y, native_sr = librosa.load(f.name, sr=None, mono=True)
+        return y.astype(np.float32), native_sr
+
+    def head(self, seconds: float = DURATION_SECONDS) -> np.ndarray:
+        """
+        Mono float32 samples at SAMPLE_RATE for the first `seconds` of the recording.
+        Reuses the full decode when there is one, otherwise reads only the head.
+        """
+        length = int(seconds * SAMPLE_RATE)
+        with self._lock:
+            if self._samples is not None:
+                return self._samples[:length]
+        try:
+            with sf.SoundFile(self.open()) as f:
+                native_sr = f.samplerate
+                # One second past the head keeps the resampler's edge effects out of it
+                y = f.read(int((seconds + 1) * native_sr), dtype='float32', always_2d=True).mean(axis=1)
+        except Exception:
+            y, native_sr = self.native
+            y = y[:int((seconds + 1) * native_sr)]
+        if native_sr != SAMPLE_RATE and len(y):
+            y = librosa.resample(y, orig_sr=native_sr, target_sr=SAMPLE_RATE)
+        return y[:length]
+
+    @property
+    def samples(self) -> np.ndarray:
+        y, native_sr = self.native
+        with self._lock:
+            if self._samples is None:
+                if native_sr != SAMPLE_RATE and len(y):
+                    y = librosa.resample(y, orig_sr=native_sr, target_sr=SAMPLE_RATE)
+                self._samples = y
+            return self._samples
+
+def preprocess_waveform(y):
+    """Preprocesses mono samples at SAMPLE_RATE for the Hybrid Model (Mel-spectrogram)."""
+    try:
+        max_len = SAMPLE_RATE * DURATION_SECONDS
+        if len(y) > max_len:
+             y = y[:max_len]
+             
+        y = librosa.util.normalize(y)
+
+        if len(y) < FIXED_LENGTH:
+            y = np.pad(y, (0, int(FIXED_LENGTH - len(y))), mode='constant')
+        else:
+            y = y[:int(FIXED_LENGTH)]
+
+        spectrogram = librosa.feature.melspectrogram(y=y, sr=SAMPLE_RATE, n_mels=N_MELS)
+        
+        max_val = np.max(spectrogram)
+        if max_val == 0: max_val = 1e-9
+        log_spectrogram = librosa.power_to_db(spectrogram, ref=max_val)
+
+        # Reshape for model input (batch_size, height, width, channels)
+        result = np.expand_dims(np.expand_dims(log_spectrogram, axis=-1), axis=0)
+        return result
+    except Exception as e:
+        print(f"Error in preprocess_audio: {e}")
+        return None
+
+@lru_cache(maxsize=None)
+def mel_filterbank() -> np.ndarray:
+    return librosa.filters.mel(sr=SAMPLE_RATE, n_fft=N_FFT, n_mels=N_MELS)
+
+def log_mel_from_stft(D, y):
+    """
+    The hybrid model input computed from D, the centered STFT (N_FFT / HOP_LENGTH)
+    of the whole waveform y, instead of a second STFT. Matches preprocess_waveform(y):
+    frames whose window lies inside the first FIXED_LENGTH samples are reused, and
+    the few frames that reach the truncation / zero-padding boundary are recomputed.
+    """
+    head = y[:FIXED_LENGTH]
+    if len(head) == 0:
+        return None
+    # librosa.util.normalize scales by the peak; the STFT is linear, so scale its power instead
+    peak = np.max(np.abs(head))
+    scale = 1.0 / peak if peak > np.finfo(head.dtype).tiny else 1.0
+
+    if len(y) <= FIXED_LENGTH:
+        shared = min(N_FRAMES, D.shape[1])
+    else:
+        shared = min(N_FRAMES, (FIXED_LENGTH - N_FFT // 2) // HOP_LENGTH + 1)
+    frames = D[:, :shared]
+    if shared < N_FRAMES:
+        padded = np.pad(head, (N_FFT // 2, FIXED_LENGTH - len(head) + N_FFT // 2))
+        tail = padded[shared * HOP_LENGTH:(N_FRAMES - 1) * HOP_LENGTH + N_FFT]
+        frames = np.concatenate([frames, librosa.stft(tail, n_fft=N_FFT, hop_length=HOP_LENGTH, center=False)], axis=1)
+
+    power = np.abs(frames) ** 2 * np.float32(scale ** 2)
+    spectrogram = mel_filterbank() @ power
+
+    max_val = np.max(spectrogram)
+    if max_val == 0: max_val = 1e-9
+    log_spectrogram = librosa.power_to_db(spectrogram, ref=max_val)
+    return np.expand_dims(np.expand_dims(log_spectrogram, axis=-1), axis=0)
+
+def shared_features(engine, y, with_mel=True):
+    """
+    Fingerprint and (optionally) hybrid model input from a single STFT of y.
+    Returns (hashes, offsets, mel_input); mel_input is None when not requested
+    or when the engine's STFT does not match the model's front end.
+    """
+    if len(y) == 0:
+        hashes, offsets = engine.generate_hash_arrays([])
+        return hashes, offsets, None
+    D = engine._stft(y)
+    hashes, offsets = engine.fingerprint_stft(D)
+    mel_input = None
+    if with_mel and (engine.sampling_rate, engine.n_fft, engine.hop_length) == (SAMPLE_RATE, N_FFT, HOP_LENGTH):
+        try:
+            mel_input = log_mel_from_stft(D, y)
+        except Exception as e:
+            print(f"Error in log_mel_from_stft: {e}")
+    return hashes, offsets, mel_input
+
+def preprocess_audio(audio_path):
+    """Preprocesses an audio file for the Hybrid Model (Mel-spectrogram)."""
+    return preprocess_waveform(AudioContext.from_file(audio_path).samples)
+
+def worker_ready():
+    """Run once in each worker process at startup so the feature modules are already imported."""
+    import fingerprint_engine  # noqa: F401
+    return True
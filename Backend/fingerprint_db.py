@@ -0,0 +1,250 @@
+import hashlib
+import json
+import math
+import os
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+from fingerprint_engine import HASH_PACKED, HASH_SHA1_64, HASH_SHA1, HASH_FORMATS, PEAKS_DIAMOND, PEAKS_NUMBA, sha1_to_int64
+
+# Shared SQLite schema helpers for the fingerprint database.
+# Used by app.py (read path) and scripts/db_tools.py (build / migrate).
+
+# A hash is a stop hash (silence, DTMF tones, hold music, IVR prompts...) when it occurs in
+# at least this share of the indexed files, and in no fewer than STOP_MIN_DF files.
+STOP_DF_RATIO = 0.05
+STOP_MIN_DF = 10
+
+def blob_to_int(value):
+    """
+    Offsets written by the original build tool: numpy int64 values bound through the
+    buffer protocol were stored as 8-byte little-endian BLOBs. Other values pass through.
+    """
+    return int.from_bytes(value, 'little', signed=True) if isinstance(value, bytes) else value
+
+def has_table(conn: sqlite3.Connection, name: str) -> bool:
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone()
+    return row is not None
+
+def has_column(conn: sqlite3.Connection, table: str, column: str) -> bool:
+    return any(row[1] == column for row in conn.execute(f"PRAGMA table_info({table})"))
+
+def has_catalog(conn: sqlite3.Connection) -> bool:
+    """True when fingerprints reference the files catalog by integer id (False for legacy file_name rows)."""
+    return has_table(conn, 'files') and has_column(conn, 'fingerprints', 'file_id')
+
+def get_meta(conn: sqlite3.Connection, key: str, default=None):
+    if not has_table(conn, 'meta'):
+        return default
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+def set_meta(conn: sqlite3.Connection, key: str, value) -> None:
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+def get_hash_format(conn: sqlite3.Connection) -> str:
+    """
+    Returns the hash format stored in the database.
+    Databases built before the meta table existed hold legacy SHA-1 strings.
+    """
+    if not has_table(conn, 'fingerprints'):
+        return get_meta(conn, 'hash_format', HASH_PACKED)
+    return get_meta(conn, 'hash_format', HASH_SHA1)
+
+def get_peak_strategy(conn: sqlite3.Connection) -> str:
+    return get_meta(conn, 'peak_strategy', PEAKS_DIAMOND)
+
+def peak_strategies_compatible(a: str, b: str) -> bool:
+    """The numba kernel produces exactly the diamond peaks, so the two can share a DB."""
+    family = lambda s: PEAKS_DIAMOND if s == PEAKS_NUMBA else s
+    return family(a) == family(b)
+
+def get_stop_df(conn: sqlite3.Connection):
+    """Document frequency at which a hash becomes a stop hash, or None if not computed."""
+    value = get_meta(conn, 'stop_df')
+    return int(value) if value is not None else None
+
+def build_stop_hashes(conn: sqlite3.Connection, df_ratio: float = STOP_DF_RATIO, min_df: int = STOP_MIN_DF) -> int:
+    """
+    Recomputes per-hash document frequency and stores the stop hashes in the
+    stop_hashes table. Returns the document frequency threshold.
+    """
+    file_column = 'file_id' if has_catalog(conn) else 'file_name'
+    num_files = conn.execute(f"SELECT COUNT(DISTINCT {file_column}) FROM fingerprints").fetchone()[0]
+    stop_df = max(min_df, math.ceil(df_ratio * num_files))
+    conn.execute("DROP TABLE IF EXISTS stop_hashes")
+    conn.execute(f'''
+        CREATE TABLE stop_hashes AS
+        SELECT hash, COUNT(DISTINCT {file_column}) AS df FROM fingerprints
+        GROUP BY hash HAVING COUNT(DISTINCT {file_column}) >= ?
+    ''', (stop_df,))
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_stop_hash ON stop_hashes (hash)")
+    set_meta(conn, 'stop_df', stop_df)
+    conn.commit()
+    return stop_df
+
+def create_catalog(conn: sqlite3.Connection) -> None:
+    """
+    Creates the files catalog: one row per indexed audio file. Fingerprint rows
+    reference it by its small integer id instead of repeating the file name.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS files (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            scam_type TEXT,
+            duration REAL,
+            n_hashes INTEGER NOT NULL DEFAULT 0,
+            content_sha TEXT
+        )
+    ''')
+
+def create_manifest(conn: sqlite3.Connection) -> None:
+    """
+    Creates the build manifest: the size, mtime and content hash of every dataset
+    path at the time it was fingerprinted, so incremental builds can skip it.
+    The engine params the rows were built with are stored once, as the
+    engine_params_version meta value.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS manifest (
+            path TEXT PRIMARY KEY,
+            file_id INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            content_sha TEXT NOT NULL
+        )
+    ''')
+
+def params_version(params: dict) -> str:
+    """Short digest of FingerprintEngine.params(); changes whenever the generated hashes would."""
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+def create_schema(conn: sqlite3.Connection, hash_format: str = HASH_PACKED) -> None:
+    """Creates the files catalog, the build manifest and the fingerprints table for the given hash format if they do not exist."""
+    if hash_format not in HASH_FORMATS:
+        raise ValueError(f"Unknown hash format: {hash_format}")
+    hash_type = 'TEXT' if hash_format == HASH_SHA1 else 'INTEGER'
+    create_catalog(conn)
+    create_manifest(conn)
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS fingerprints (
+            hash {hash_type} NOT NULL,
+            file_id INTEGER NOT NULL,
+            offset INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_hash ON fingerprints (hash)')
+    # Legacy databases are left without a meta row so older readers keep working
+    if hash_format != HASH_SHA1:
+        set_meta(conn, 'hash_format', hash_format)
+    conn.commit()
+
+def migrate_to_integer(conn: sqlite3.Connection) -> int:
+    """
+    Converts a legacy TEXT fingerprint table to INTEGER keys in place.
+    SHA-1 digests cannot be inverted back to peak pairs, so the legacy strings are
+    truncated to their first 64 bits (HASH_SHA1_64) rather than re-packed.
+    BLOB offsets of the original build tool are decoded to integers on the way.
+    Returns the number of migrated rows.
+    """
+    if get_hash_format(conn) != HASH_SHA1:
+        return 0
+
+    file_column, file_type = ('file_id', 'INTEGER') if has_catalog(conn) else ('file_name', 'TEXT')
+    conn.create_function('sha1_to_int64', 1, sha1_to_int64, deterministic=True)
+    conn.create_function('blob_to_int', 1, blob_to_int, deterministic=True)
+    conn.execute('DROP TABLE IF EXISTS fingerprints_int')
+    conn.execute(f'''
+        CREATE TABLE fingerprints_int (
+            hash INTEGER NOT NULL,
+            {file_column} {file_type} NOT NULL,
+            offset INTEGER NOT NULL
+        )
+    ''')
+    conn.execute(f'''
+        INSERT INTO fingerprints_int (hash, {file_column}, offset)
+        SELECT sha1_to_int64(hash), {file_column}, blob_to_int(offset) FROM fingerprints
+    ''')
+    count = conn.execute('SELECT COUNT(*) FROM fingerprints_int').fetchone()[0]
+    conn.execute('DROP TABLE fingerprints')
+    conn.execute('ALTER TABLE fingerprints_int RENAME TO fingerprints')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_hash ON fingerprints (hash)')
+    set_meta(conn, 'hash_format', HASH_SHA1_64)
+    conn.commit()
+    return count
+
+def migrate_to_catalog(conn: sqlite3.Connection, scam_types: Optional[Dict[str, str]] = None) -> int:
+    """
+    Moves the file names of a legacy fingerprint table into the files catalog and
+    rewrites the rows to reference it by integer id. scam_types maps file names
+    to scam types for the new catalog rows. Returns the number of catalogued files.
+    """
+    if has_catalog(conn) or not has_table(conn, 'fingerprints'):
+        return 0
+
+    hash_type = 'TEXT' if get_hash_format(conn) == HASH_SHA1 else 'INTEGER'
+    create_catalog(conn)
+    conn.execute('''
+        INSERT OR IGNORE INTO files (name, n_hashes)
+        SELECT file_name, COUNT(*) FROM fingerprints GROUP BY file_name ORDER BY file_name
+    ''')
+    conn.executemany("UPDATE files SET scam_type = ? WHERE name = ?",
+                     [(scam_type, name) for name, scam_type in (scam_types or {}).items()])
+    conn.create_function('blob_to_int', 1, blob_to_int, deterministic=True)
+    conn.execute('DROP TABLE IF EXISTS fingerprints_id')
+    conn.execute(f'''
+        CREATE TABLE fingerprints_id (
+            hash {hash_type} NOT NULL,
+            file_id INTEGER NOT NULL,
+            offset INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('''
+        INSERT INTO fingerprints_id (hash, file_id, offset)
+        SELECT f.hash, files.id, blob_to_int(f.offset) FROM fingerprints AS f JOIN files ON files.name = f.file_name
+    ''')
+    conn.execute('DROP TABLE fingerprints')
+    conn.execute('ALTER TABLE fingerprints_id RENAME TO fingerprints')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_hash ON fingerprints (hash)')
+    conn.commit()
+    return conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+def scam_type_from_path(path: str) -> str:
+    """Dataset files are grouped into one folder per scam type."""
+    return os.path.basename(os.path.dirname(os.path.abspath(path)))
+
+def store_file(conn: sqlite3.Connection, name: str, hashes, offsets, scam_type: Optional[str] = None,
+               duration: Optional[float] = None, content_sha: Optional[str] = None, replace: bool = True) -> int:
+    """
+    Adds or replaces one file: its catalog row and all of its fingerprints.
+    replace=False skips deleting the file's old fingerprints, for callers that
+    already removed them in bulk. Does not commit. Returns the file id.
+    """
+    row = conn.execute("SELECT id FROM files WHERE name = ?", (name,)).fetchone()
+    if row is None:
+        file_id = conn.execute(
+            "INSERT INTO files (name, scam_type, duration, n_hashes, content_sha) VALUES (?, ?, ?, ?, ?)",
+            (name, scam_type, duration, len(hashes), content_sha)).lastrowid
+    else:
+        file_id = row[0]
+        conn.execute("UPDATE files SET scam_type = ?, duration = ?, n_hashes = ?, content_sha = ? WHERE id = ?",
+                     (scam_type, duration, len(hashes), content_sha, file_id))
+        if replace:
+            conn.execute("DELETE FROM fingerprints WHERE file_id = ?", (file_id,))
+    conn.executemany("INSERT INTO fingerprints (hash, file_id, offset) VALUES (?, ?, ?)",
+                     ((h, file_id, offset) for h, offset in zip(hashes.tolist(), offsets.tolist())))
+    return file_id
+
+def delete_files(conn: sqlite3.Connection, file_ids) -> None:
+    """Removes files from the catalog together with their fingerprints and manifest entries. Does not commit."""
+    ids = json.dumps([int(file_id) for file_id in file_ids])
+    conn.execute("DELETE FROM fingerprints WHERE file_id IN (SELECT value FROM json_each(?))", (ids,))
+    conn.execute("DELETE FROM manifest WHERE file_id IN (SELECT value FROM json_each(?))", (ids,))
+    conn.execute("DELETE FROM files WHERE id IN (SELECT value FROM json_each(?))", (ids,))
+
+def load_catalog(conn: sqlite3.Connection) -> List[Tuple[int, str, Optional[str]]]:
+    """(id, name, scam_type) of every catalogued file, by id."""
+    if not has_table(conn, 'files'):
+        return []
+    return conn.execute("SELECT id, name, scam_type FROM files ORDER BY id").fetchall()
@@ -1,18 +1,120 @@
 import librosa
 import numpy as np
 import scipy.ndimage
+import soundfile as sf
+import soxr
 import hashlib
-from typing import List, Tuple, Dict
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Iterable, Iterator, List, Tuple, Dict, Optional, Union
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Target zone for the time delta between an anchor peak and its paired peak (in frames)
+MAX_T_DELTA = 200
+
+# Seconds of audio decoded per block by fingerprint_stream
+STREAM_BLOCK_SECONDS = 30.0
+
+# Peak picking strategies
+PEAKS_DIAMOND = "diamond"      # diamond-footprint maximum filter (reference)
+PEAKS_SEPARABLE = "separable"  # square neighborhood as two 1-D max filters
+PEAKS_TOPK = "topk"            # strongest local maxima per time band
+PEAKS_NUMBA = "numba"          # JIT kernel, same output as diamond
+PEAK_STRATEGIES = (PEAKS_DIAMOND, PEAKS_SEPARABLE, PEAKS_TOPK, PEAKS_NUMBA)
+
+# Hash formats
+HASH_PACKED = "packed"    # freq1/freq2/t_delta bit-packed into an int64
+HASH_SHA1_64 = "sha1_64"  # first 64 bits of the legacy SHA-1 digest as a signed int64
+HASH_SHA1 = "sha1"        # legacy 20-char hex SHA-1 string
+HASH_FORMATS = (HASH_PACKED, HASH_SHA1_64, HASH_SHA1)
+
+def sha1_to_int64(digest: str) -> int:
+    """Converts a legacy hex digest to the signed int64 used by HASH_SHA1_64."""
+    value = int(digest[:16], 16)
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+def _diamond_peak_mask(S: np.ndarray, radius: int, amp_min: float) -> np.ndarray:
+    """
+    Direct scan equivalent to the diamond maximum filter + background erosion.
+    Only points above amp_min are checked and each scan stops at the first larger neighbor.
+    """
+    n_freq, n_time = S.shape
+    mask = np.zeros((n_freq, n_time), dtype=np.bool_)
+    for f in range(n_freq):
+        for t in range(n_time):
+            value = S[f, t]
+            if value <= amp_min:
+                continue
+            is_max = True
+            all_zero = value == 0
+            for df in range(-radius, radius + 1):
+                ff = f + df
+                if ff < 0 or ff >= n_freq:
+                    continue
+                span = radius - abs(df)
+                for dt in range(-span, span + 1):
+                    tt = t + dt
+                    if tt < 0 or tt >= n_time:
+                        continue
+                    neighbor = S[ff, tt]
+                    if neighbor > value:
+                        is_max = False
+                        break
+                    if neighbor != 0:
+                        all_zero = False
+                if not is_max:
+                    break
+            mask[f, t] = is_max and not all_zero
+    return mask
+
+_numba_diamond_peak_mask = numba.njit(cache=True)(_diamond_peak_mask) if numba is not None else None
 
 class FingerprintEngine:
-    def __init__(self, sampling_rate: int = 22050, n_fft: int = 2048, hop_length: int = 512):
+    def __init__(self, sampling_rate: int = 22050, n_fft: int = 2048, hop_length: int = 512, hash_format: str = HASH_PACKED, peak_strategy: str = PEAKS_DIAMOND):
+        if hash_format not in HASH_FORMATS:
+            raise ValueError(f"Unknown hash format: {hash_format}")
+        if peak_strategy not in PEAK_STRATEGIES:
+            raise ValueError(f"Unknown peak strategy: {peak_strategy}")
+        if peak_strategy == PEAKS_NUMBA and numba is None:
+            print("WARNING: numba is not installed, falling back to the diamond peak filter.")
+            peak_strategy = PEAKS_DIAMOND
         self.sampling_rate = sampling_rate
         self.n_fft = n_fft
         self.hop_length = hop_length
+        self.hash_format = hash_format
         # Parameters for peak finding
         self.amp_min = -60  # Minimum amplitude (dB) to consider a peak. 0 is max.
         self.fan_value = 15  # Max number of pairs per peak
         self.neighborhood_size = 20 # Size of the neighborhood for local maxima
+        self.peak_strategy = peak_strategy
+        # Parameters for the top-k strategy
+        self.band_frames = 43  # ~1 second of frames per band
+        self.peak_density = 25  # Max peaks per second
+
+    def params(self) -> Dict[str, Union[int, float, str]]:
+        """
+        Every parameter that affects the generated hashes.
+        Engines with equal params produce identical fingerprints.
+        """
+        return {
+            'sampling_rate': self.sampling_rate,
+            'n_fft': self.n_fft,
+            'hop_length': self.hop_length,
+            'amp_min': self.amp_min,
+            'fan_value': self.fan_value,
+            'neighborhood_size': self.neighborhood_size,
+            'max_t_delta': MAX_T_DELTA,
+            'hash_format': self.hash_format,
+            # The numba kernel finds exactly the diamond peaks
+            'peak_strategy': PEAKS_DIAMOND if self.peak_strategy == PEAKS_NUMBA else self.peak_strategy,
+            'band_frames': self.band_frames,
+            'peak_density': self.peak_density,
+        }
 
     def load_audio(self, file_path: str) -> np.ndarray:
         """Loads audio and resamples to the target sampling rate."""
@@ -24,18 +126,34 @@ class FingerprintEngine:
             print(f"Error loading audio file {file_path}: {e}")
             return np.array([])
 
+    def _stft(self, y: np.ndarray) -> np.ndarray:
+        """Complex short-time Fourier transform (centered frames)."""
+        return librosa.stft(y, n_fft=self.n_fft, hop_length=self.hop_length)
+
     def _get_spectrogram(self, y: np.ndarray) -> np.ndarray:
         """Generates a spectrogram from the audio signal."""
-        # Short-time Fourier transform
-        D = librosa.stft(y, n_fft=self.n_fft, hop_length=self.hop_length)
+        return self._stft_to_db(self._stft(y))
+
+    def _stft_to_db(self, D: np.ndarray) -> np.ndarray:
+        """dB magnitude spectrogram from a complex STFT."""
         # Convert to magnitude spectrogram
         S = np.abs(D)
         # Convert to log scale (dB) which is better for audio processing
         # We use a small offset to avoid log(0)
         return librosa.amplitude_to_db(S, ref=np.max)
 
-    def _find_peaks(self, S: np.ndarray) -> List[Tuple[int, int]]:
-        """Finds local maxima (peaks) in the spectrogram."""
+    def _peak_mask(self, S: np.ndarray, frame_offset: int = 0) -> np.ndarray:
+        """
+        Boolean mask of local maxima above the amplitude threshold.
+        frame_offset is the absolute index of S[:, 0], used to align top-k time bands.
+        """
+        if self.peak_strategy == PEAKS_SEPARABLE:
+            return self._separable_peak_mask(S, self.neighborhood_size)
+        if self.peak_strategy == PEAKS_TOPK:
+            return self._topk_peak_mask(S, frame_offset)
+        if self.peak_strategy == PEAKS_NUMBA:
+            return _numba_diamond_peak_mask(np.ascontiguousarray(S, dtype=np.float32), self.neighborhood_size, float(self.amp_min))
+
         # Define the structure for local maximum filter
         # It defines the area around a point to check if it is the maximum
         structure = scipy.ndimage.generate_binary_structure(2, 1)
@@ -49,56 +167,393 @@ class FingerprintEngine:
         eroded_background = scipy.ndimage.binary_erosion(background, structure=neighborhood, border_value=1)
         detected_peaks = local_max ^ eroded_background
 
-        # Get coordinates of peaks
+        return detected_peaks & (S > self.amp_min)
+
+    def _separable_peak_mask(self, S: np.ndarray, radius: int) -> np.ndarray:
+        """
+        Local maxima over a (2r+1) x (2r+1) square, computed as two 1-D max filters.
+        The square contains the diamond, so this keeps a subset of the diamond peaks.
+        """
+        size = 2 * radius + 1
+        local_max = scipy.ndimage.maximum_filter1d(scipy.ndimage.maximum_filter1d(S, size, axis=0), size, axis=1) == S
+
+        # Same background rule as the diamond filter: drop flat all-zero regions (silence)
+        background = (S == 0).view(np.uint8)
+        eroded_background = scipy.ndimage.minimum_filter1d(
+            scipy.ndimage.minimum_filter1d(background, size, axis=0, mode='constant', cval=1),
+            size, axis=1, mode='constant', cval=1
+        ).astype(bool)
+
+        return local_max & ~eroded_background & (S > self.amp_min)
+
+    def _topk_peak_mask(self, S: np.ndarray, frame_offset: int = 0) -> np.ndarray:
+        """
+        Keeps the strongest local maxima in each time band of band_frames frames,
+        capped at peak_density peaks per second of audio.
+        """
+        candidates = self._separable_peak_mask(S, max(self.neighborhood_size // 2, 1))
+        freq_indices, time_indices = np.nonzero(candidates)
+        if len(freq_indices) == 0:
+            return candidates
+
+        frames_per_second = self.sampling_rate / self.hop_length
+        k = max(int(np.ceil(self.peak_density * self.band_frames / frames_per_second)), 1)
+        bands = (time_indices + frame_offset) // self.band_frames
+        # Sort by band, strongest first; rank within the band by position
+        order = np.lexsort((-S[freq_indices, time_indices], bands))
+        sorted_bands = bands[order]
+        band_starts = np.flatnonzero(np.r_[True, sorted_bands[1:] != sorted_bands[:-1]])
+        band_lengths = np.diff(np.r_[band_starts, len(order)])
+        ranks = np.arange(len(order)) - np.repeat(band_starts, band_lengths)
+        keep = order[ranks < k]
+
+        mask = np.zeros_like(candidates)
+        mask[freq_indices[keep], time_indices[keep]] = True
+        return mask
+
+    def find_peak_arrays(self, S: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds peaks with the configured strategy.
+        Returns (freq_indices, time_indices) sorted by time, then frequency.
+        """
+        # Scanning the transposed mask yields time-major order directly
+        time_indices, freq_indices = np.nonzero(self._peak_mask(S).T)
+        return freq_indices.astype(np.int64), time_indices.astype(np.int64)
+
+    def _find_peaks(self, S: np.ndarray) -> List[Tuple[int, int]]:
+        """Finds local maxima (peaks) in the spectrogram."""
         # Return as (frequency_idx, time_idx)
-        peaks = []
-        freq_indices, time_indices = np.where(detected_peaks & (S > self.amp_min))
-        for f, t in zip(freq_indices, time_indices):
-            peaks.append((f, t))
-            
-        return peaks
+        freq_indices, time_indices = self.find_peak_arrays(S)
+        return list(zip(freq_indices.tolist(), time_indices.tolist()))
+
+    def _pair_peaks(self, peaks: List[Tuple[int, int]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Builds every anchor/target pair inside the fan-out window as array operations.
+        Returns (freq1, freq2, t_delta, t1) arrays in the same order as the legacy loop.
+        """
+        if len(peaks) < 2:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, empty, empty
+
+        coords = np.asarray(peaks, dtype=np.int64)
+        # Stable sort keeps the frequency ordering of peaks sharing a time index
+        order = np.argsort(coords[:, 1], kind='stable')
+        return self._pair_sorted_peaks(coords[order, 0], coords[order, 1])
 
-    def _generate_hashes(self, peaks: List[Tuple[int, int]]) -> List[Tuple[str, int]]:
+    def _pair_sorted_peaks(self, freqs: np.ndarray, times: np.ndarray, n_anchors: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Pairs time-sorted peaks. Only the first n_anchors peaks are used as anchors;
+        the remaining ones are still available as targets.
+        """
+        n = len(freqs)
+        if n_anchors is None:
+            n_anchors = n
+        # Column j-1 holds the pair (i, i + j); rows are anchors, so a row-major
+        # flatten reproduces the anchor-major order of the nested loop.
+        steps = np.arange(1, self.fan_value)
+        anchors = np.arange(n_anchors)[:, None]
+        targets = anchors + steps[None, :]
+        valid = targets < n
+        targets = np.where(valid, targets, 0)
+
+        t_delta = times[targets] - times[anchors]
+        valid &= (t_delta >= 0) & (t_delta <= MAX_T_DELTA)
+
+        anchor_idx = np.broadcast_to(anchors, valid.shape)[valid]
+        target_idx = targets[valid]
+        return freqs[anchor_idx], freqs[target_idx], t_delta[valid], times[anchor_idx]
+
+    def generate_hash_arrays(self, peaks: List[Tuple[int, int]], hash_format: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Vectorized combinatorial hashing.
+        Returns (hashes, offsets) as contiguous arrays. Hashes are int64 keys for the
+        integer formats, or the legacy 20-char SHA-1 strings for HASH_SHA1.
+        """
+        freq1, freq2, t_delta, t1 = self._pair_peaks(peaks)
+        return self._encode_hashes(freq1, freq2, t_delta, t1, hash_format)
+
+    def _encode_hashes(self, freq1: np.ndarray, freq2: np.ndarray, t_delta: np.ndarray, t1: np.ndarray, hash_format: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+        hash_format = hash_format or self.hash_format
+        offsets = np.ascontiguousarray(t1, dtype=np.int32)
+        packed = self._pack_hashes(freq1, freq2, t_delta)
+
+        if hash_format == HASH_PACKED:
+            return packed, offsets
+
+        # SHA-1 is only evaluated once per distinct (freq1, freq2, t_delta) triple
+        _, first, inverse = np.unique(packed, return_index=True, return_inverse=True)
+        sha1 = hashlib.sha1
+        digests = [
+            sha1(f"{f1}|{f2}|{dt}".encode('utf-8')).hexdigest()[:20]
+            for f1, f2, dt in zip(freq1[first].tolist(), freq2[first].tolist(), t_delta[first].tolist())
+        ]
+        if hash_format == HASH_SHA1_64:
+            unique_hashes = np.array([sha1_to_int64(d) for d in digests], dtype=np.int64)
+        else:
+            unique_hashes = np.array(digests, dtype='<U20')
+        return np.ascontiguousarray(unique_hashes[inverse.reshape(-1)]), offsets
+
+    def _pack_hashes(self, freq1: np.ndarray, freq2: np.ndarray, t_delta: np.ndarray) -> np.ndarray:
+        """Packs (freq1, freq2, t_delta) into a single int64 key."""
+        freq_bits = (self.n_fft // 2).bit_length()
+        delta_bits = MAX_T_DELTA.bit_length()
+        packed = (freq1.astype(np.int64) << (freq_bits + delta_bits)) | (freq2.astype(np.int64) << delta_bits) | t_delta.astype(np.int64)
+        return np.ascontiguousarray(packed)
+
+    def _generate_hashes(self, peaks: List[Tuple[int, int]]) -> List[Tuple[Union[int, str], int]]:
         """
         Generates hashes from peaks using combinatorial hashing.
-        Returns a list of (hash_string, time_offset).
+        Returns a list of (hash, time_offset) in the engine's hash format.
         """
-        # Sort peaks by time
-        peaks.sort(key=lambda x: x[1])
-        
-        hashes = []
-        for i in range(len(peaks)):
-            for j in range(1, self.fan_value):
-                if (i + j) < len(peaks):
-                    freq1 = peaks[i][0]
-                    freq2 = peaks[i + j][0]
-                    t1 = peaks[i][1]
-                    t2 = peaks[i + j][1]
-                    t_delta = t2 - t1
-
-                    # Create a hash from the frequency pair and time delta
-                    # Determine a target zone for time delta to limit connections
-                    if 0 <= t_delta <= 200: 
-                        h = hashlib.sha1(f"{freq1}|{freq2}|{t_delta}".encode('utf-8'))
-                        # Store hash and the time offset of the anchor point
-                        hashes.append((h.hexdigest()[:20], t1))
-        
-        return hashes
+        hashes, offsets = self.generate_hash_arrays(peaks)
+        return list(zip(hashes.tolist(), offsets.tolist()))
+
+    def fingerprint_arrays(self, file_path: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Fingerprints an audio file.
+        Returns (hashes, offsets) as arrays.
+        """
+        return self.fingerprint_waveform(self.load_audio(file_path))
 
-    def fingerprint_file(self, file_path: str) -> List[Tuple[str, int]]:
+    def fingerprint_waveform(self, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Fingerprints mono samples already at the engine's sampling rate.
+        Returns (hashes, offsets) as arrays.
+        """
+        if len(y) == 0:
+            return self.generate_hash_arrays([])
+        return self.fingerprint_stft(self._stft(y))
+
+    def fingerprint_stft(self, D: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Fingerprints a precomputed complex STFT (n_fft / hop_length of this engine),
+        so it can be shared with other spectral features.
+        """
+        if D.shape[1] == 0:
+            return self.generate_hash_arrays([])
+        S = self._stft_to_db(D)
+        freqs, times = self.find_peak_arrays(S)
+        return self._encode_hashes(*self._pair_sorted_peaks(freqs, times))
+
+    def fingerprint_file(self, file_path: str) -> List[Tuple[Union[int, str], int]]:
         """
         Public method to fingerprint an audio file.
         Returns list of (hash, offset).
         """
-        y = self.load_audio(file_path)
-        if len(y) == 0:
-            return []
-            
-        S = self._get_spectrogram(y)
-        peaks = self._find_peaks(S)
-        hashes = self._generate_hashes(peaks)
-        
-        return hashes
+        hashes, offsets = self.fingerprint_arrays(file_path)
+        return list(zip(hashes.tolist(), offsets.tolist()))
+
+    # --- Batch ---
+
+    def fingerprint_many(self, paths: Iterable[str], workers: Optional[int] = None, ordered: bool = True) -> Iterator[Tuple[str, np.ndarray, np.ndarray]]:
+        """
+        Fingerprints many files in a process pool.
+        Yields (path, hashes, offsets) in input order, or as files complete when
+        ordered=False; hashes and offsets are None for files that could not be
+        decoded (or decode to no samples). Each worker holds one copy of this engine's configuration and
+        sends results back as arrays. workers defaults to the number of CPUs;
+        workers=1 runs in the calling process.
+        """
+        workers = workers or os.cpu_count() or 1
+        if workers == 1:
+            for path in paths:
+                yield (path, *_fingerprint_path(self, path))
+            return
+
+        # Keep a bounded number of files in flight so results do not pile up in memory
+        max_pending = workers * 4
+        path_iter = iter(paths)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(self,)) as executor:
+            pending = deque()
+            for path in path_iter:
+                pending.append(executor.submit(_fingerprint_in_worker, path))
+                if len(pending) >= max_pending:
+                    break
+
+            while pending:
+                if ordered:
+                    done = [pending.popleft()]
+                else:
+                    completed, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    done = [f for f in pending if f in completed]
+                    for f in done:
+                        pending.remove(f)
+
+                for future in done:
+                    yield future.result()
+                    next_path = next(path_iter, None)
+                    if next_path is not None:
+                        pending.append(executor.submit(_fingerprint_in_worker, next_path))
+
+    # --- Streaming ---
+
+    def _iter_audio_blocks(self, file_path: str, block_seconds: float) -> Iterator[Tuple[np.ndarray, bool]]:
+        """
+        Decodes audio block by block, downmixed and resampled to the target rate.
+        Yields (samples, is_last).
+        """
+        try:
+            sound_file = sf.SoundFile(file_path)
+        except Exception:
+            # Formats libsndfile cannot stream are decoded in full
+            y = self.load_audio(file_path)
+            block_size = max(int(block_seconds * self.sampling_rate), 1)
+            for start in range(0, len(y), block_size):
+                yield y[start:start + block_size], start + block_size >= len(y)
+            return
+
+        with sound_file:
+            native_sr = sound_file.samplerate
+            block_size = max(int(block_seconds * native_sr), 1)
+            resampler = None
+            if native_sr != self.sampling_rate:
+                resampler = soxr.ResampleStream(native_sr, self.sampling_rate, 1, dtype='float32', quality='HQ')
+
+            # read() returns only the frames actually decoded. blocks() trusts the header's frame
+            # count, which libsndfile only estimates for MP3, and pads the tail with garbage.
+            block = sound_file.read(block_size, dtype='float32', always_2d=True)
+            while len(block):
+                # A short read is the real end of the stream
+                if len(block) == block_size:
+                    next_block = sound_file.read(block_size, dtype='float32', always_2d=True)
+                else:
+                    next_block = block[:0]
+                last = len(next_block) == 0
+                y = block.mean(axis=1)
+                if resampler is not None:
+                    y = resampler.resample_chunk(y, last=last)
+                yield y, last
+                block = next_block
+
+    def fingerprint_stream(self, file_path: str, block_seconds: float = STREAM_BLOCK_SECONDS) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Fingerprints an audio file (a path or a file-like object) in bounded memory.
+        Yields (hashes, offsets) per decoded block as soon as they are final, so
+        callers can start matching before decoding finishes.
+
+        The dB reference is the running maximum magnitude rather than the maximum
+        of the whole file, so hashes can differ slightly from fingerprint_arrays
+        on recordings that get much louder later on.
+        """
+        stream = StreamFingerprinter(self)
+        try:
+            for y, last in self._iter_audio_blocks(file_path, block_seconds):
+                hashes, offsets = stream.push(y, last)
+                if len(offsets):
+                    yield hashes, offsets
+        except Exception as e:
+            print(f"Error streaming audio file {file_path}: {e}")
+
+class StreamFingerprinter:
+    """
+    Incremental fingerprinting of audio that arrives in blocks (a long file being
+    decoded, or a live call). push() takes mono samples at the engine's sampling
+    rate and returns the hashes that became final. Memory stays bounded: only the
+    STFT tail, the frames still needed as peak context and the peaks not yet used
+    as anchors are kept between calls.
+    """
+
+    def __init__(self, engine: FingerprintEngine):
+        self.engine = engine
+        self.ref = 0.0  # running maximum magnitude, the dB reference
+        self.samples_seen = 0
+        self._buffer = np.zeros(engine.n_fft // 2, dtype=np.float32)  # centered STFT padding
+        self._mags = np.empty((engine.n_fft // 2 + 1, 0), dtype=np.float32)  # frames kept as peak context
+        self._mags_start = 0  # absolute frame index of _mags[:, 0]
+        self._next_frame = 0  # first frame whose peaks are not decided yet
+        self._pending_freqs = np.empty(0, dtype=np.int64)  # sorted peaks not yet used as anchors
+        self._pending_times = np.empty(0, dtype=np.int64)
+
+    def _stft_frames(self, y: np.ndarray, last: bool) -> np.ndarray:
+        """
+        Magnitude STFT of the new samples. Frames line up with librosa.stft(center=True),
+        so concatenating the returned blocks gives the same frames as the full-signal STFT.
+        """
+        engine = self.engine
+        pad = engine.n_fft // 2
+        if last:
+            y = np.concatenate([y, np.zeros(pad, dtype=np.float32)])
+        buffer = np.concatenate([self._buffer, y.astype(np.float32, copy=False)])
+
+        n_frames = 0
+        if len(buffer) >= engine.n_fft:
+            n_frames = 1 + (len(buffer) - engine.n_fft) // engine.hop_length
+        if n_frames == 0:
+            self._buffer = buffer
+            return np.empty((pad + 1, 0), dtype=np.float32)
+
+        used = (n_frames - 1) * engine.hop_length + engine.n_fft
+        D = librosa.stft(buffer[:used], n_fft=engine.n_fft, hop_length=engine.hop_length, center=False)
+        self._buffer = buffer[n_frames * engine.hop_length:]
+        return np.abs(D)
+
+    def push(self, y: np.ndarray, last: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """Adds samples; last=True flushes everything. Returns the new (hashes, offsets)."""
+        engine = self.engine
+        margin = engine.neighborhood_size
+        self.samples_seen += len(y)
+        frames = self._stft_frames(y, last)
+        if frames.shape[1]:
+            self.ref = max(self.ref, float(frames.max()))
+            self._mags = np.concatenate([self._mags, frames], axis=1)
+
+        # A peak is final once the full neighborhood after it has been seen
+        total = self._mags_start + self._mags.shape[1]
+        final_end = total if last else total - margin
+        if engine.peak_strategy == PEAKS_TOPK and not last:
+            # Top-k bands are only ranked once all their frames are present
+            final_end -= final_end % engine.band_frames
+        if final_end > self._next_frame:
+            S = librosa.amplitude_to_db(self._mags, ref=self.ref if self.ref > 0 else 1.0, top_db=None)
+            S = np.maximum(S, -80.0)
+            mask = engine._peak_mask(S, self._mags_start)[:, self._next_frame - self._mags_start:final_end - self._mags_start]
+            freq_indices, time_indices = np.where(mask)
+            order = np.argsort(time_indices, kind='stable')
+            self._pending_freqs = np.concatenate([self._pending_freqs, freq_indices[order]])
+            self._pending_times = np.concatenate([self._pending_times, time_indices[order] + self._next_frame])
+            self._next_frame = final_end
+
+            keep_from = max(self._next_frame - margin, self._mags_start)
+            self._mags = self._mags[:, keep_from - self._mags_start:]
+            self._mags_start = keep_from
+
+        # An anchor is final once its fan_value - 1 targets are known, or once
+        # no undecided peak can fall inside its t_delta window
+        if last:
+            n_anchors = len(self._pending_freqs)
+        else:
+            by_fan = max(len(self._pending_freqs) - (engine.fan_value - 1), 0)
+            by_time = int(np.searchsorted(self._pending_times, self._next_frame - MAX_T_DELTA, side='left'))
+            n_anchors = max(by_fan, by_time)
+
+        if not n_anchors:
+            return engine.generate_hash_arrays([])
+        pairs = engine._pair_sorted_peaks(self._pending_freqs, self._pending_times, n_anchors)
+        self._pending_freqs = self._pending_freqs[n_anchors:]
+        self._pending_times = self._pending_times[n_anchors:]
+        return engine._encode_hashes(*pairs)
+
+# --- Process pool workers ---
+
+_worker_engine = None
+
+def _init_worker(engine: FingerprintEngine) -> None:
+    global _worker_engine
+    _worker_engine = engine
+
+def _fingerprint_path(engine: FingerprintEngine, path: str) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+    # load_audio reports decode errors itself and returns no samples
+    y = engine.load_audio(path)
+    if len(y) == 0:
+        return None, None
+    try:
+        return engine.fingerprint_waveform(y)
+    except Exception as e:
+        print(f"Error fingerprinting {path}: {e}")
+        return None, None
+
+def _fingerprint_in_worker(path: str) -> Tuple[str, np.ndarray, np.ndarray]:
+    return (path, *_fingerprint_path(_worker_engine, path))
 
 if __name__ == "__main__":
     # Simple test
@@ -0,0 +1,673 @@
+import os
+import json
+import mmap
+import sqlite3
+import struct
+import threading
+import time
+import numpy as np
+from typing import List, Optional, Tuple
+from fingerprint_engine import FingerprintEngine, HASH_PACKED, HASH_SHA1, HASH_SHA1_64, PEAKS_DIAMOND, sha1_to_int64
+from fingerprint_db import blob_to_int, has_table, has_catalog, get_hash_format, get_peak_strategy, get_stop_df, load_catalog
+from sqlite_pool import ConnectionPool, connect_readonly
+
+# Rows fetched per round trip while loading the index from SQLite
+LOAD_CHUNK_ROWS = 200000
+
+# Query hashes scored per step by MatchSession before checking the stop bound
+MATCH_CHUNK_SIZE = 1024
+
+# Query hashes sent per statement by the SQLite backend (as one JSON parameter)
+SQL_QUERY_MAX_HASHES = 250000
+
+# Set-based vote aggregation of the SQLite backend in a single statement: the query is a
+# JSON array of distinct [hash, offset, multiplicity] triples, joined against idx_hash,
+# binned by (file, offset delta), reduced to each file's best bin (SQLite returns the
+# bare delta column of the MAX(hits) row). One fixed statement, so it stays prepared.
+SQL_VOTE_QUERY = '''
+    WITH q AS (
+        SELECT json_extract(value, '$[0]') AS hash, json_extract(value, '$[1]') AS offset,
+               json_extract(value, '$[2]') AS n
+        FROM json_each(?)
+    ), bins AS (
+        SELECT f.file_id AS file_id, f.offset - q.offset AS delta, SUM(q.n) AS hits
+        FROM q CROSS JOIN fingerprints AS f ON f.hash = q.hash
+        GROUP BY f.file_id, delta
+    )
+    SELECT file_id, delta, MAX(hits) FROM bins GROUP BY file_id
+'''
+
+# Index backends served by IndexHolder
+BACKEND_MEMORY = "memory"  # memory-mapped index file, or the DB loaded into memory
+BACKEND_SQLITE = "sqlite"  # queries the DB directly through pooled read-only connections
+
+# On-disk index file layout:
+#   magic (8 bytes) | format version (uint32) | header length (uint32) | JSON header
+#   followed by a data section with the keys, file_ids, offsets, doc_keys and doc_freq
+#   arrays, each aligned to ALIGNMENT bytes. The JSON header holds the engine params,
+#   the stop-hash threshold, the array positions within the data section and the file catalog
+#   (names and scam types, by file id).
+INDEX_MAGIC = b'NEMOFPX\0'
+INDEX_VERSION = 3
+ALIGNMENT = 64
+_PREAMBLE = struct.Struct('<8sII')
+
+def _align(position: int) -> int:
+    return (position + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def _catalog_positions(catalog) -> Tuple[np.ndarray, List[str], List[Optional[str]]]:
+    """
+    Maps catalog ids (which may have gaps) to consecutive file ids.
+    Returns (file id of every catalog id, file names, scam types).
+    """
+    ids = np.array([row[0] for row in catalog], dtype=np.int64)
+    positions = np.full(int(ids.max()) + 1 if len(ids) else 0, -1, dtype=np.int32)
+    positions[ids] = np.arange(len(ids), dtype=np.int32)
+    return positions, [row[1] for row in catalog], [row[2] for row in catalog]
+
+def _document_frequencies(keys: np.ndarray, file_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Distinct keys and the number of distinct files per key, for rows sorted by (key, file id)."""
+    if len(keys) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32)
+    new_key = np.r_[True, keys[1:] != keys[:-1]]
+    new_doc = new_key | np.r_[True, file_ids[1:] != file_ids[:-1]]
+    key_starts = np.flatnonzero(new_key)
+    doc_freq = np.add.reduceat(new_doc.astype(np.int32), key_starts)
+    return np.ascontiguousarray(keys[key_starts]), doc_freq.astype(np.int32)
+
+class FingerprintIndex:
+    """
+    Array-backed inverted index over the fingerprints table.
+    Rows are sorted by hash (then file id) so lookups are two binary searches per
+    query hash; MatchSession votes over the hits by integer file id, which indexes
+    the file_names and scam_types lists of the files catalog.
+    doc_keys / doc_freq hold the number of distinct files containing each hash;
+    hashes found in at least stop_df files are stop hashes and are never queried.
+    SQLite remains the source of truth; the index is a read-only snapshot.
+    """
+
+    def __init__(self, keys: np.ndarray, file_ids: np.ndarray, offsets: np.ndarray, file_names: List[str],
+                 hash_format: str = HASH_PACKED, peak_strategy: str = PEAKS_DIAMOND,
+                 doc_keys: Optional[np.ndarray] = None, doc_freq: Optional[np.ndarray] = None,
+                 stop_df: Optional[int] = None, buffer: Optional[mmap.mmap] = None,
+                 scam_types: Optional[List[Optional[str]]] = None):
+        # Keeps the mapping alive while the arrays are views into it
+        self._buffer = buffer
+        self.keys = keys
+        self.file_ids = file_ids
+        self.offsets = offsets
+        self.file_names = file_names
+        self.scam_types = scam_types if scam_types is not None else [None] * len(file_names)
+        self.hash_format = hash_format
+        self.peak_strategy = peak_strategy
+        if doc_keys is None or doc_freq is None:
+            doc_keys, doc_freq = _document_frequencies(keys, file_ids)
+        self.doc_keys = doc_keys
+        self.doc_freq = doc_freq
+        self.stop_df = stop_df
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @property
+    def num_files(self) -> int:
+        return len(self.file_names)
+
+    @property
+    def engine_config(self) -> dict:
+        """FingerprintEngine keyword arguments producing hashes comparable with this index."""
+        return {'hash_format': self.hash_format, 'peak_strategy': self.peak_strategy}
+
+    @classmethod
+    def empty(cls, hash_format: str = HASH_PACKED, peak_strategy: str = PEAKS_DIAMOND) -> 'FingerprintIndex':
+        return cls(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32), [], hash_format, peak_strategy)
+
+    @classmethod
+    def from_arrays(cls, hashes: np.ndarray, file_ids: np.ndarray, offsets: np.ndarray, file_names: List[str],
+                    hash_format: str = HASH_PACKED, peak_strategy: str = PEAKS_DIAMOND, stop_df: Optional[int] = None,
+                    scam_types: Optional[List[Optional[str]]] = None) -> 'FingerprintIndex':
+        """Builds an index from unsorted rows."""
+        order = np.lexsort((file_ids, hashes))
+        return cls(
+            np.ascontiguousarray(hashes[order], dtype=np.int64),
+            np.ascontiguousarray(file_ids[order], dtype=np.int32),
+            np.ascontiguousarray(offsets[order], dtype=np.int32),
+            list(file_names),
+            hash_format,
+            peak_strategy,
+            stop_df=stop_df,
+            scam_types=list(scam_types) if scam_types is not None else None,
+        )
+
+    @classmethod
+    def from_sqlite(cls, db_path: str) -> 'FingerprintIndex':
+        """
+        Loads every fingerprint row and the files catalog into memory.
+        Legacy TEXT hashes are converted to their 64-bit prefix, so the index of a
+        legacy DB must be queried with HASH_SHA1_64 hashes. Legacy rows without a
+        catalog are keyed by file name and have no scam types; their BLOB offsets
+        (see blob_to_int) are decoded on the way.
+        """
+        if not os.path.exists(db_path):
+            print(f"Fingerprint DB not found at {db_path}, using an empty index.")
+            return cls.empty()
+
+        conn = connect_readonly(db_path)
+        try:
+            hash_format = get_hash_format(conn)
+            peak_strategy = get_peak_strategy(conn)
+            stop_df = get_stop_df(conn)
+            legacy = hash_format == HASH_SHA1
+            if legacy:
+                hash_format = HASH_SHA1_64
+            if not has_table(conn, 'fingerprints'):
+                return cls.empty(hash_format, peak_strategy)
+
+            catalog = has_catalog(conn)
+            if catalog:
+                positions, file_names, scam_types = _catalog_positions(load_catalog(conn))
+            else:
+                file_ids_by_name, scam_types = {}, None
+            hash_chunks, id_chunks, offset_chunks = [], [], []
+            conn.create_function('blob_to_int', 1, blob_to_int, deterministic=True)
+            cursor = conn.execute(f"SELECT hash, {'file_id' if catalog else 'file_name'}, "
+                                  f"CASE WHEN typeof(offset) = 'blob' THEN blob_to_int(offset) ELSE offset END FROM fingerprints")
+            while True:
+                rows = cursor.fetchmany(LOAD_CHUNK_ROWS)
+                if not rows:
+                    break
+                hashes, files, offsets = zip(*rows)
+                if legacy:
+                    hashes = [sha1_to_int64(h) for h in hashes]
+                hash_chunks.append(np.array(hashes, dtype=np.int64))
+                if catalog:
+                    id_chunks.append(positions[np.array(files, dtype=np.int64)])
+                else:
+                    id_chunks.append(np.array([file_ids_by_name.setdefault(n, len(file_ids_by_name)) for n in files], dtype=np.int32))
+                offset_chunks.append(np.array(offsets, dtype=np.int32))
+        finally:
+            conn.close()
+
+        if not hash_chunks:
+            return cls.empty(hash_format, peak_strategy)
+        return cls.from_arrays(
+            np.concatenate(hash_chunks),
+            np.concatenate(id_chunks),
+            np.concatenate(offset_chunks),
+            file_names if catalog else list(file_ids_by_name),
+            hash_format,
+            peak_strategy,
+            stop_df,
+            scam_types,
+        )
+
+    def save(self, path: str) -> None:
+        """
+        Writes the index to a binary file that load() can memory-map.
+        The file is written next to the target and renamed into place, so processes
+        that have the old file mapped keep a consistent view.
+        """
+        engine = FingerprintEngine(**self.engine_config)
+        arrays = [
+            ('keys', self.keys, '<i8'), ('file_ids', self.file_ids, '<i4'), ('offsets', self.offsets, '<i4'),
+            ('doc_keys', self.doc_keys, '<i8'), ('doc_freq', self.doc_freq, '<i4'),
+        ]
+
+        header = {
+            'engine_params': engine.params(),
+            'stop_df': self.stop_df,
+            'file_names': self.file_names,
+            'scam_types': self.scam_types,
+            'arrays': {},
+        }
+        # Array offsets are relative to the start of the data section
+        position = 0
+        for name, array, dtype in arrays:
+            header['arrays'][name] = {'dtype': dtype, 'offset': position, 'count': len(array)}
+            position = _align(position + len(array) * np.dtype(dtype).itemsize)
+        header_bytes = json.dumps(header).encode('utf-8')
+        data_start = _align(_PREAMBLE.size + len(header_bytes))
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(_PREAMBLE.pack(INDEX_MAGIC, INDEX_VERSION, len(header_bytes)))
+            f.write(header_bytes)
+            for name, array, dtype in arrays:
+                f.write(b'\0' * (data_start + header['arrays'][name]['offset'] - f.tell()))
+                np.ascontiguousarray(array, dtype=dtype).tofile(f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, expected_params: Optional[dict] = None) -> 'FingerprintIndex':
+        """
+        Memory-maps an index written by save(). The arrays are read-only views into
+        the page cache, so every process mapping the same file shares one copy.
+        Raises ValueError if the file is not a compatible index or was built with
+        engine params different from expected_params.
+        """
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            magic, version, header_length = _PREAMBLE.unpack_from(buffer, 0)
+        except struct.error:
+            raise ValueError(f"{path} is too short to be a fingerprint index")
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{path} is not a fingerprint index")
+        if version != INDEX_VERSION:
+            raise ValueError(f"{path} has index format version {version}, expected {INDEX_VERSION}")
+        header = json.loads(buffer[_PREAMBLE.size:_PREAMBLE.size + header_length])
+
+        params = header['engine_params']
+        engine = FingerprintEngine(hash_format=params['hash_format'], peak_strategy=params['peak_strategy'])
+        expected_params = expected_params or engine.params()
+        mismatched = {k: (params.get(k), v) for k, v in expected_params.items() if params.get(k) != v}
+        if mismatched:
+            details = ', '.join(f"{k}: index={a!r} engine={b!r}" for k, (a, b) in mismatched.items())
+            raise ValueError(f"{path} was built with different engine parameters ({details})")
+
+        data_start = _align(_PREAMBLE.size + header_length)
+        views = {}
+        for name, info in header['arrays'].items():
+            views[name] = np.frombuffer(buffer, dtype=np.dtype(info['dtype']), count=info['count'], offset=data_start + info['offset'])
+
+        return cls(views['keys'], views['file_ids'], views['offsets'], header['file_names'],
+                   params['hash_format'], params['peak_strategy'],
+                   doc_keys=views['doc_keys'], doc_freq=views['doc_freq'],
+                   stop_df=header['stop_df'], buffer=buffer, scam_types=header['scam_types'])
+
+    def document_frequency(self, hashes: np.ndarray) -> np.ndarray:
+        """Number of indexed files containing each hash (0 for unknown hashes)."""
+        hashes = np.asarray(hashes, dtype=np.int64)
+        if len(self.doc_keys) == 0:
+            return np.zeros(len(hashes), dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.doc_keys, hashes), len(self.doc_keys) - 1)
+        found = self.doc_keys[positions] == hashes
+        return np.where(found, self.doc_freq[positions], 0).astype(np.int64)
+
+    def stop_mask(self, hashes: np.ndarray) -> np.ndarray:
+        """True for stop hashes (present in at least stop_df files)."""
+        if not self.stop_df:
+            return np.zeros(len(hashes), dtype=bool)
+        return self.document_frequency(hashes) >= self.stop_df
+
+    def idf(self, hashes: np.ndarray) -> np.ndarray:
+        """Smoothed inverse document frequency weight of each hash."""
+        return np.log((1 + self.num_files) / (1 + self.document_frequency(hashes))) + 1.0
+
+    def query_weight(self, hashes: np.ndarray) -> float:
+        """Total IDF weight of the hashes that survive stop-hash pruning."""
+        hashes = np.asarray(hashes, dtype=np.int64)
+        return float(self.idf(hashes[~self.stop_mask(hashes)]).sum())
+
+    def lookup_pairs(self, hashes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (rows, query_positions): every stored row matching a query hash,
+        together with the position of that hash in the query.
+        """
+        hashes = np.asarray(hashes, dtype=np.int64)
+        left = np.searchsorted(self.keys, hashes, side='left')
+        right = np.searchsorted(self.keys, hashes, side='right')
+        counts = right - left
+        total = int(counts.sum())
+        if total == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty
+        # Expand each [left, right) range into consecutive row positions
+        starts = np.repeat(left, counts)
+        run_offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        return starts + run_offsets, np.repeat(np.arange(len(hashes)), counts)
+
+    def file_info(self, file_id: int) -> Tuple[str, Optional[str]]:
+        """(name, scam type) of a file id; the scam type is None when the catalog has none."""
+        return self.file_names[file_id], self.scam_types[file_id]
+
+    def session(self, stop_weight: Optional[float] = None, stop_hits: Optional[int] = None) -> 'MatchSession':
+        return MatchSession(self, stop_weight=stop_weight, stop_hits=stop_hits)
+
+    def match_many(self, queries, stop_weights=None) -> List['MatchSession']:
+        return match_many(self, queries, stop_weights)
+
+    def info(self) -> dict:
+        return {
+            'backend': BACKEND_MEMORY,
+            'memory_mapped': self._buffer is not None,
+            'hashes': len(self),
+            'files': self.num_files,
+            'hash_format': self.hash_format,
+            'peak_strategy': self.peak_strategy,
+            'stop_df': self.stop_df,
+        }
+
+def _sum_bins(bins: np.ndarray, weights: np.ndarray, hits: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Distinct sorted bins with the summed weights and hits of their votes."""
+    bins, inverse = np.unique(bins, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    weights = np.bincount(inverse, weights=weights, minlength=len(bins))
+    hits = np.bincount(inverse, weights=hits, minlength=len(bins)).astype(np.int64)
+    return bins, weights, hits
+
+class MatchSession:
+    """
+    Offset-consistent matching against a FingerprintIndex.
+    Stop hashes are dropped before querying. Every remaining hit votes for
+    (file, db_offset - query_offset) with the IDF weight of its hash; a file's
+    score is the weight of its largest aligned bin, so hits on common hashes
+    scattered across a file do not add up. Query hashes are processed in chunks
+    and the session stops as soon as the best bin reaches stop_weight aligned
+    weight or stop_hits aligned hits.
+    """
+
+    def __init__(self, index: FingerprintIndex, stop_weight: Optional[float] = None, stop_hits: Optional[int] = None,
+                 chunk_size: int = MATCH_CHUNK_SIZE):
+        self.index = index
+        self.stop_weight = stop_weight
+        self.stop_hits = stop_hits
+        self.chunk_size = chunk_size
+        self.hashes_queried = 0
+        self.hashes_pruned = 0
+        self.stopped = False
+        # Sorted runs of distinct (file_id << 32 | biased delta) bins with their vote
+        # weights and hit counts; a bin's votes are its sum over the runs. Runs are
+        # merged like a binary counter, so voting stays O(n log n) over a long query.
+        self._runs = []
+        self._best_key = None
+        self._best_weight = 0.0
+        self._best_hits = 0
+
+    def add(self, hashes: np.ndarray, offsets: np.ndarray) -> bool:
+        """
+        Queries the hashes chunk by chunk. Returns True once a stop bound has been
+        reached; the remaining hashes are then skipped.
+        """
+        hashes, offsets = self._prune(hashes, offsets)
+        for start in range(0, len(hashes), self.chunk_size):
+            if self.stopped:
+                break
+            end = start + self.chunk_size
+            self._vote(hashes[start:end], offsets[start:end])
+            self.hashes_queried += len(hashes[start:end])
+            if self._best_key is not None and self._reached_bound():
+                self.stopped = True
+        return self.stopped
+
+    def _prune(self, hashes: np.ndarray, offsets: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        hashes = np.asarray(hashes, dtype=np.int64)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        keep = ~self.index.stop_mask(hashes)
+        self.hashes_pruned += int(len(hashes) - keep.sum())
+        return hashes[keep], offsets[keep]
+
+    def _reached_bound(self) -> bool:
+        if self.stop_weight is not None and self._best_weight >= self.stop_weight:
+            return True
+        return self.stop_hits is not None and self._best_hits >= self.stop_hits
+
+    def _vote(self, hashes: np.ndarray, offsets: np.ndarray) -> None:
+        rows, query_positions = self.index.lookup_pairs(hashes)
+        self._vote_hits(hashes, offsets, rows, query_positions)
+
+    def _vote_hits(self, hashes: np.ndarray, offsets: np.ndarray, rows: np.ndarray, query_positions: np.ndarray) -> None:
+        if len(rows) == 0:
+            return
+        deltas = self.index.offsets[rows].astype(np.int64) - offsets[query_positions]
+        self._add_votes(self.index.file_ids[rows], deltas, self.index.idf(hashes)[query_positions])
+
+    def _add_votes(self, file_ids: np.ndarray, deltas: np.ndarray, weights: np.ndarray, hits: Optional[np.ndarray] = None) -> None:
+        """Adds weighted votes for (file, offset delta) bins; hits defaults to one per vote."""
+        if len(file_ids) == 0:
+            return
+        if hits is None:
+            hits = np.ones(len(file_ids))
+        bins = (np.asarray(file_ids, dtype=np.int64) << 32) | ((np.asarray(deltas, dtype=np.int64) + (1 << 31)) & 0xFFFFFFFF)
+        bins, weights, hits = _sum_bins(bins, weights, hits)
+
+        # Votes only add weight, so the best bin is the previous best or one of the bins
+        # voted for here; ties go to the lowest bin, as with argmax over all bins
+        total_weights, total_hits = weights.copy(), hits.copy()
+        for run_bins, run_weights, run_hits in self._runs:
+            positions = np.minimum(np.searchsorted(run_bins, bins), len(run_bins) - 1)
+            found = run_bins[positions] == bins
+            total_weights[found] += run_weights[positions[found]]
+            total_hits[found] += run_hits[positions[found]]
+        top = int(np.argmax(total_weights))
+        if (self._best_key is None or total_weights[top] > self._best_weight
+                or (total_weights[top] == self._best_weight and bins[top] <= self._best_key)):
+            self._best_key = int(bins[top])
+            self._best_weight = float(total_weights[top])
+            self._best_hits = int(total_hits[top])
+
+        self._runs.append((bins, weights, hits))
+        while len(self._runs) > 1 and 2 * len(self._runs[-1][0]) >= len(self._runs[-2][0]):
+            (bins_a, weights_a, hits_a), (bins_b, weights_b, hits_b) = self._runs.pop(-2), self._runs.pop()
+            self._runs.append(_sum_bins(np.concatenate([bins_a, bins_b]), np.concatenate([weights_a, weights_b]),
+                                        np.concatenate([hits_a, hits_b])))
+
+    def best(self) -> Tuple[Optional[int], int, float, int]:
+        """
+        Returns (file_id, aligned_hits, aligned_weight, offset_frames) of the best aligned match;
+        index.file_info(file_id) resolves the id to the file's name and scam type.
+        """
+        if self._best_key is None:
+            return None, 0, 0.0, 0
+        file_id = self._best_key >> 32
+        offset = (self._best_key & 0xFFFFFFFF) - (1 << 31)
+        return file_id, self._best_hits, self._best_weight, offset
+
+def match_many(index: FingerprintIndex, queries, stop_weights=None) -> List[MatchSession]:
+    """
+    Matches several (hashes, offsets) queries with one combined index lookup.
+    Each query's stop hashes are pruned, the remaining hashes of all queries are
+    looked up together, and the hits are split back and voted in one MatchSession
+    per query. There is no chunked early stop; a session is marked stopped when
+    its stop_weight is reached.
+    """
+    sessions = []
+    pruned = []
+    for i, (hashes, offsets) in enumerate(queries):
+        session = MatchSession(index, stop_weight=stop_weights[i] if stop_weights is not None else None)
+        sessions.append(session)
+        pruned.append(session._prune(hashes, offsets))
+    if not sessions:
+        return sessions
+
+    bounds = np.cumsum([0] + [len(hashes) for hashes, _ in pruned])
+    rows, positions = index.lookup_pairs(np.concatenate([hashes for hashes, _ in pruned]))
+    # Hits come back in query-hash order, so each query's hits are one contiguous run
+    splits = np.searchsorted(positions, bounds)
+    for i, (session, (hashes, offsets)) in enumerate(zip(sessions, pruned)):
+        hits = slice(splits[i], splits[i + 1])
+        session._vote_hits(hashes, offsets, rows[hits], positions[hits] - bounds[i])
+        session.hashes_queried = len(hashes)
+        session.stopped = session._best_key is not None and session._reached_bound()
+    return sessions
+
+class SQLiteIndex:
+    """
+    Serves matching straight from the fingerprint DB instead of an in-memory index:
+    nothing is loaded up front, which suits corpora too large to hold in memory.
+    Lookups run on a ConnectionPool of read-only connections, so SQLite's page cache
+    stays warm between requests. Same matching interface as FingerprintIndex
+    (session, match_many, stop_mask, query_weight). Per-hash document frequencies
+    are not stored in the DB, so every non-stop hit weighs 1 instead of its IDF.
+    """
+
+    def __init__(self, db_path: str, pool_size: int = 4):
+        self.db_path = db_path
+        self.pool = ConnectionPool(db_path, pool_size)
+        with self.pool.connection() as conn:
+            self.hash_format = get_hash_format(conn)
+            if self.hash_format == HASH_SHA1:
+                raise ValueError("legacy TEXT hashes; run scripts/db_tools.py --migrate to query the DB directly")
+            self.peak_strategy = get_peak_strategy(conn)
+            self.stop_df = get_stop_df(conn)
+            if not has_catalog(conn):
+                raise ValueError("no files catalog; run scripts/db_tools.py --migrate to query the DB directly")
+            stop_hashes = []
+            if has_table(conn, 'stop_hashes'):
+                stop_hashes = [row[0] for row in conn.execute("SELECT hash FROM stop_hashes")]
+            # Read once: a rebuild replaces the DB file, which makes IndexHolder load a new SQLiteIndex
+            self._positions, self.file_names, self.scam_types = _catalog_positions(load_catalog(conn))
+        self.stop_hashes = np.unique(np.array(stop_hashes, dtype=np.int64))
+
+    @property
+    def engine_config(self) -> dict:
+        return {'hash_format': self.hash_format, 'peak_strategy': self.peak_strategy}
+
+    def stop_mask(self, hashes: np.ndarray) -> np.ndarray:
+        return np.isin(np.asarray(hashes, dtype=np.int64), self.stop_hashes)
+
+    def query_weight(self, hashes: np.ndarray) -> float:
+        """Number of hashes that survive stop-hash pruning (every hit weighs 1)."""
+        return float(len(hashes) - self.stop_mask(hashes).sum())
+
+    @property
+    def num_files(self) -> int:
+        return len(self.file_names)
+
+    def file_info(self, file_id: int) -> Tuple[str, Optional[str]]:
+        return self.file_names[file_id], self.scam_types[file_id]
+
+    def lookup_votes(self, hashes: np.ndarray, offsets: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        (file_ids, offset deltas, hits) of the best aligned bin of every file matching the query.
+        Repeated (hash, offset) pairs are sent once with their multiplicity, and the
+        votes are aggregated by SQL_VOTE_QUERY, so only one row per file comes back.
+        """
+        empty = np.empty(0, dtype=np.int64)
+        if len(hashes) == 0:
+            return empty, empty, np.empty(0)
+        hashes = np.asarray(hashes, dtype=np.int64)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        order = np.lexsort((offsets, hashes))
+        hashes, offsets = hashes[order], offsets[order]
+        starts = np.flatnonzero(np.r_[True, (hashes[1:] != hashes[:-1]) | (offsets[1:] != offsets[:-1])])
+        counts = np.diff(np.r_[starts, len(hashes)])
+        query = json.dumps(np.column_stack([hashes[starts], offsets[starts], counts]).tolist())
+        with self.pool.connection() as conn:
+            rows = conn.execute(SQL_VOTE_QUERY, (query,)).fetchall()
+        if not rows:
+            return empty, empty, np.empty(0)
+        catalog_ids, deltas, hits = zip(*rows)
+        file_ids = self._positions[np.array(catalog_ids, dtype=np.int64)].astype(np.int64)
+        return file_ids, np.array(deltas, dtype=np.int64), np.array(hits, dtype=np.float64)
+
+    def session(self, stop_weight: Optional[float] = None, stop_hits: Optional[int] = None) -> 'SQLiteMatchSession':
+        return SQLiteMatchSession(self, stop_weight=stop_weight, stop_hits=stop_hits, chunk_size=SQL_QUERY_MAX_HASHES)
+
+    def match_many(self, queries, stop_weights=None) -> List['SQLiteMatchSession']:
+        sessions = []
+        for i, (hashes, offsets) in enumerate(queries):
+            session = self.session(stop_weight=stop_weights[i] if stop_weights is not None else None)
+            session.add(hashes, offsets)
+            sessions.append(session)
+        return sessions
+
+    def info(self) -> dict:
+        return {
+            'backend': BACKEND_SQLITE,
+            'db_path': self.db_path,
+            'files': self.num_files,
+            'hash_format': self.hash_format,
+            'peak_strategy': self.peak_strategy,
+            'stop_df': self.stop_df,
+            'stop_hashes': len(self.stop_hashes),
+            'pool': self.pool.info(),
+        }
+
+class SQLiteMatchSession(MatchSession):
+    """
+    MatchSession whose votes are aggregated in SQL by an SQLiteIndex.
+    Each add() is one statement that keeps only every file's best aligned bin,
+    so bins split across separate add() calls (streamed blocks) are only merged
+    where they were the best of their block.
+    """
+
+    def _vote(self, hashes: np.ndarray, offsets: np.ndarray) -> None:
+        file_ids, deltas, hits = self.index.lookup_votes(hashes, offsets)
+        self._add_votes(file_ids, deltas, hits, hits)
+
+class IndexHolder:
+    """
+    Keeps a FingerprintIndex loaded, together with an engine configured to match
+    it, and reloads both when the source file changes on disk.
+    The memory-mapped index file is used when it exists (shared by all worker
+    processes); otherwise the SQLite DB is loaded into process memory. With the
+    sqlite backend the DB is queried directly through an SQLiteIndex instead.
+    """
+
+    def __init__(self, db_path: str, index_path: Optional[str] = None, backend: str = BACKEND_MEMORY, pool_size: int = 4):
+        if backend not in (BACKEND_MEMORY, BACKEND_SQLITE):
+            raise ValueError(f"Unknown index backend: {backend}")
+        self.db_path = db_path
+        self.index_path = index_path if backend == BACKEND_MEMORY else None
+        self.backend = backend
+        self.pool_size = pool_size
+        # (engine, index, source) published in one assignment, so readers never
+        # pair an engine with an index it was not configured for
+        self._loaded = None
+        self._lock = threading.Lock()
+
+    @property
+    def engine(self) -> Optional[FingerprintEngine]:
+        loaded = self._loaded
+        return loaded[0] if loaded else None
+
+    @property
+    def index(self):
+        loaded = self._loaded
+        return loaded[1] if loaded else None
+
+    def _current_source(self):
+        for path in (self.index_path, self.db_path):
+            if not path:
+                continue
+            try:
+                return path, os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+        return None
+
+    def _load(self, source):
+        if self.backend == BACKEND_SQLITE and source:
+            try:
+                return SQLiteIndex(self.db_path, self.pool_size)
+            except (sqlite3.Error, ValueError) as e:
+                print(f"WARNING: Cannot query {self.db_path} directly ({e}). Loading it into memory instead.")
+        if source and source[0] == self.index_path:
+            try:
+                return FingerprintIndex.load(self.index_path)
+            except (OSError, ValueError, KeyError) as e:
+                print(f"WARNING: Rejected fingerprint index {self.index_path}: {e}. Loading {self.db_path} instead.")
+        return FingerprintIndex.from_sqlite(self.db_path)
+
+    @property
+    def version(self) -> str:
+        """Identifies the index currently on disk; changes whenever it is rebuilt."""
+        source = self._current_source()
+        return f"{source[0]}@{source[1]}" if source else "none"
+
+    def get(self) -> Tuple[FingerprintEngine, FingerprintIndex]:
+        source = self._current_source()
+        loaded = self._loaded
+        if loaded is not None and loaded[2] == source:
+            return loaded[0], loaded[1]
+        with self._lock:
+            return self._reload(source)
+
+    def _reload(self, source) -> Tuple[FingerprintEngine, FingerprintIndex]:
+        loaded = self._loaded
+        if loaded is None or loaded[2] != source:
+            start = time.time()
+            index = self._load(source)
+            engine = FingerprintEngine(**index.engine_config)
+            loaded = self._loaded = (engine, index, source)
+            if isinstance(index, SQLiteIndex):
+                print(f"Fingerprint DB {self.db_path} served through up to {index.pool.size} read-only connections "
+                      f"(hash format: {engine.hash_format}, peak strategy: {engine.peak_strategy}).")
+            else:
+                origin = "memory-mapped" if index._buffer is not None else "loaded"
+                print(f"Fingerprint index {origin}: {len(index)} hashes from {index.num_files} files "
+                      f"in {time.time() - start:.2f} seconds "
+                      f"(hash format: {engine.hash_format}, peak strategy: {engine.peak_strategy}).")
+        return loaded[0], loaded[1]
@@ -0,0 +1,119 @@
+import asyncio
+import numpy as np
+
+def batch_buckets(max_batch_size: int):
+    """Powers of two up to max_batch_size (inclusive): the batch shapes that get served."""
+    buckets = []
+    size = 1
+    while size < max_batch_size:
+        buckets.append(size)
+        size *= 2
+    buckets.append(max_batch_size)
+    return tuple(buckets)
+
+class MicroBatcher:
+    """
+    Groups concurrent calls into one batched call.
+    Callers submit their arguments; a background task takes up to max_batch_size
+    of them, waiting at most max_wait_ms after the first one arrives, runs
+    batch_fn(list of argument tuples) on the given executor and resolves each
+    caller's future with its entry of the returned list. Only one batch runs at a
+    time, so calls arriving while it runs make up the next batch.
+    """
+
+    def __init__(self, batch_fn, max_batch_size: int = 16, max_wait_ms: float = 10.0, executor=None):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.executor = executor
+        self._queue = None
+        self._task = None
+        self.batches = 0
+        self.requests = 0
+        self.failed_batches = 0
+        self.max_batch_seen = 0
+
+    def _ensure_running(self) -> None:
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, *args):
+        self._ensure_running()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((args, future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # Anything that queued up in the meantime rides along
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Requests whose client went away are dropped before the batched call
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                continue
+            try:
+                results = await loop.run_in_executor(self.executor, self.batch_fn, [args for args, _ in batch])
+            except Exception as e:
+                self.failed_batches += 1
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.requests += len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def info(self) -> dict:
+        avg_batch = self.requests / self.batches if self.batches else 0.0
+        return {
+            'batches': self.batches,
+            'requests': self.requests,
+            'failed_batches': self.failed_batches,
+            'avg_batch_size': avg_batch,
+            'avg_batch_fill': avg_batch / self.max_batch_size,
+            'max_batch_seen': self.max_batch_seen,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait_ms,
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+        }
+
+class InferenceBatcher(MicroBatcher):
+    """
+    Groups concurrent hybrid model requests into one forward pass.
+    Requests queue their (1, n_mels, frames, 1) mel tensor and transcript and
+    get their score back. predict_fn(audio_batch, transcripts) must return one
+    score per row and is run on the given executor.
+    """
+
+    def __init__(self, predict_fn, max_batch_size: int = 16, max_wait_ms: float = 10.0, executor=None):
+        super().__init__(self._predict_batch, max_batch_size, max_wait_ms, executor)
+        self.predict_fn = predict_fn
+
+    def _predict_batch(self, items):
+        audio_batch = np.concatenate([audio for audio, _ in items], axis=0)
+        return self.predict_fn(audio_batch, [transcript for _, transcript in items])
+
+    async def predict(self, audio_input: np.ndarray, transcript: str) -> float:
+        return float(await self.submit(audio_input, transcript))
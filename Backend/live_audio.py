@@ -0,0 +1,114 @@
+import io
+from collections import deque
+import numpy as np
+import soundfile as sf
+import soxr
+from audio_features import SAMPLE_RATE, FIXED_LENGTH
+from fingerprint_engine import StreamFingerprinter
+
+# Audio of a live call, received in chunks over the /ws/live WebSocket.
+# pcm_s16le / pcm_f32le: raw interleaved little-endian samples at the announced rate.
+# encoded: every chunk is a self-contained audio file (e.g. a short WAV or OGG segment).
+ENCODINGS = ('pcm_s16le', 'pcm_f32le', 'encoded')
+SAMPLE_WIDTHS = {'pcm_s16le': 2, 'pcm_f32le': 4}
+
+class LiveAudioStream:
+    """
+    A live call's audio, resampled to SAMPLE_RATE as it arrives.
+    Keeps only what the analysis needs, so memory stays bounded however long
+    the call runs: the last FIXED_LENGTH samples (the hybrid model's window),
+    samples not yet fingerprinted, and the fingerprint blocks of the last
+    match_seconds (the sliding buffer that is matched against the index).
+    """
+
+    def __init__(self, engine, encoding: str = 'pcm_s16le', sample_rate: int = SAMPLE_RATE, channels: int = 1,
+                 match_seconds: float = 30.0):
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unknown encoding: {encoding}")
+        if sample_rate <= 0 or channels <= 0:
+            raise ValueError("sample_rate and channels must be positive")
+        self.engine = engine
+        self.encoding = encoding
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.match_frames = int(match_seconds * engine.sampling_rate / engine.hop_length)
+        self.samples_received = 0  # at SAMPLE_RATE
+        self.window = np.empty(0, dtype=np.float32)
+        self.blocks = deque()  # (hashes, offsets) of the sliding match buffer
+        self._fingerprinter = StreamFingerprinter(engine)
+        self._pending = []
+        self._pending_samples = 0
+        self._remainder = b''  # partial PCM frame carried over to the next chunk
+        self._resampler = None
+        self._resampler_rate = None
+
+    @property
+    def seconds(self) -> float:
+        return self.samples_received / SAMPLE_RATE
+
+    @property
+    def pending_seconds(self) -> float:
+        return self._pending_samples / SAMPLE_RATE
+
+    def _decode(self, data: bytes):
+        """(mono float32 samples, sampling rate) of one chunk."""
+        if self.encoding == 'encoded':
+            y, rate = sf.read(io.BytesIO(data), dtype='float32', always_2d=True)
+            return y.mean(axis=1), rate
+        frame_bytes = SAMPLE_WIDTHS[self.encoding] * self.channels
+        data = self._remainder + data
+        usable = len(data) - len(data) % frame_bytes
+        self._remainder = data[usable:]
+        if self.encoding == 'pcm_s16le':
+            y = np.frombuffer(data[:usable], dtype='<i2').astype(np.float32) / 32768.0
+        else:
+            y = np.frombuffer(data[:usable], dtype='<f4').astype(np.float32)
+        return y.reshape(-1, self.channels).mean(axis=1), self.sample_rate
+
+    def _resample(self, y: np.ndarray, rate: int, last: bool = False) -> np.ndarray:
+        if rate == SAMPLE_RATE:
+            return y
+        if self._resampler is None or rate != self._resampler_rate:
+            self._resampler = soxr.ResampleStream(rate, SAMPLE_RATE, 1, dtype='float32', quality='HQ')
+            self._resampler_rate = rate
+        return self._resampler.resample_chunk(y, last=last)
+
+    def _append(self, y: np.ndarray) -> None:
+        self.samples_received += len(y)
+        self.window = np.concatenate([self.window, y])[-FIXED_LENGTH:]
+        self._pending.append(y)
+        self._pending_samples += len(y)
+
+    def feed(self, data: bytes) -> int:
+        """Adds an audio chunk. Returns the number of samples it added at SAMPLE_RATE."""
+        y, rate = self._decode(data)
+        y = self._resample(np.ascontiguousarray(y, dtype=np.float32), rate)
+        self._append(y)
+        return len(y)
+
+    def fingerprint(self, last: bool = False):
+        """
+        Fingerprints the samples received since the last call and slides the match
+        buffer forward. last=True flushes the resampler and the fingerprinter.
+        Returns the new (hashes, offsets).
+        """
+        if last and self._resampler is not None:
+            self._append(self._resample(np.empty(0, dtype=np.float32), self._resampler_rate, last=True))
+        y = np.concatenate(self._pending) if self._pending else np.empty(0, dtype=np.float32)
+        self._pending = []
+        self._pending_samples = 0
+
+        hashes, offsets = self._fingerprinter.push(y, last)
+        if len(offsets):
+            self.blocks.append((hashes, offsets))
+        # Drop blocks whose hashes all start before the sliding buffer
+        horizon = self.samples_received // self.engine.hop_length - self.match_frames
+        while self.blocks and self.blocks[0][1].max() < horizon:
+            self.blocks.popleft()
+        return hashes, offsets
+
+    def window_wav(self) -> bytes:
+        """The last FIXED_LENGTH samples as an in-memory WAV file."""
+        buffer = io.BytesIO()
+        sf.write(buffer, self.window, SAMPLE_RATE, format='WAV')
+        return buffer.getvalue()
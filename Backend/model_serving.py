@@ -0,0 +1,92 @@
+import time
+import numpy as np
+import tensorflow as tf
+
+class HybridModelServer:
+    """
+    Serves the hybrid Keras model through one concrete tf.function with a fixed
+    input signature instead of Keras predict(). Batches are padded up to the next
+    bucket size, so only len(batch_buckets) shapes are ever seen; warmup() runs a
+    synthetic batch of each of them so tracing, XLA compilation (jit_compile=True)
+    and allocation all happen before the first real request.
+    """
+
+    def __init__(self, model, batch_buckets=(1, 2, 4, 8, 16), jit_compile: bool = False):
+        self.model = model
+        self.batch_buckets = tuple(sorted(batch_buckets))
+        self.audio_shape = tuple(model.inputs[0].shape[1:])
+        self.jit_compile = jit_compile
+        self.ready = False
+        self.warmup_seconds = {}
+        self.error = None
+        self._serve = self._compile(jit_compile)
+
+    def _compile(self, jit_compile: bool):
+        model = self.model
+        signature = [
+            tf.TensorSpec((None,) + self.audio_shape, tf.float32, name='audio_input'),
+            tf.TensorSpec((None, 1), tf.string, name='text_input'),
+        ]
+
+        @tf.function(input_signature=signature, jit_compile=jit_compile)
+        def serve(audio, text):
+            return model([audio, text], training=False)
+
+        return serve.get_concrete_function()
+
+    def _bucket(self, n: int) -> int:
+        for size in self.batch_buckets:
+            if size >= n:
+                return size
+        return self.batch_buckets[-1]
+
+    def _run(self, audio_batch: np.ndarray, transcripts) -> np.ndarray:
+        n = len(transcripts)
+        size = self._bucket(n)
+        audio = np.zeros((size,) + self.audio_shape, dtype=np.float32)
+        audio[:n] = audio_batch
+        text = np.array(list(transcripts) + [""] * (size - n), dtype=object).reshape(-1, 1)
+        output = self._serve(tf.constant(audio), tf.constant(text))
+        return output.numpy()[:n, 0]
+
+    def predict(self, audio_batch: np.ndarray, transcripts) -> np.ndarray:
+        """Scores a batch of (n, *audio_shape) mel inputs with their transcripts."""
+        largest = self.batch_buckets[-1]
+        scores = [self._run(audio_batch[start:start + largest], transcripts[start:start + largest])
+                  for start in range(0, len(transcripts), largest)]
+        return np.concatenate(scores) if scores else np.empty(0, dtype=np.float32)
+
+    def warmup(self) -> None:
+        """Runs one synthetic batch per bucket, then marks the server ready."""
+        try:
+            self._warm_buckets()
+        except Exception as e:
+            if not self.jit_compile:
+                self.error = str(e)
+                print(f"WARNING: Hybrid model warm-up failed: {e}")
+                return
+            # String preprocessing inside the model may not be XLA-compilable
+            print(f"WARNING: XLA compilation failed ({e}); serving without jit_compile.")
+            self.jit_compile = False
+            self._serve = self._compile(False)
+            self.warmup_seconds = {}
+            self._warm_buckets()
+        self.ready = True
+        print(f"Hybrid model warmed up for batch sizes {list(self.batch_buckets)} "
+              f"in {sum(self.warmup_seconds.values()):.2f} seconds.")
+
+    def _warm_buckets(self) -> None:
+        for size in self.batch_buckets:
+            start = time.perf_counter()
+            self._run(np.zeros((size,) + self.audio_shape, dtype=np.float32), ["warm up"] * size)
+            self.warmup_seconds[size] = round(time.perf_counter() - start, 4)
+
+    def info(self) -> dict:
+        return {
+            'ready': self.ready,
+            'backend': 'keras',
+            'batch_buckets': list(self.batch_buckets),
+            'jit_compile': self.jit_compile,
+            'warmup_seconds': self.warmup_seconds,
+            'error': self.error,
+        }
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# Per-request fields that are not part of the analysis (e.g. stage timings) and are not stored
+TRANSIENT_FIELDS = ('stages',)
+
+def cache_key(data: bytes, *parts) -> str:
+    """Content address of an upload: SHA-256 of its bytes plus the request options."""
+    digest = hashlib.sha256(data)
+    for part in parts:
+        digest.update(b'\0')
+        digest.update(str(part).encode('utf-8'))
+    return digest.hexdigest()
+
+class ResultCache:
+    """
+    Two-tier cache of /predict responses keyed on upload content.
+    The in-process tier is an LRU bounded by entry count and TTL; the optional
+    SQLite tier survives restarts. Every entry carries the version it was
+    computed under (fingerprint index + model), and a version change drops all
+    older entries from both tiers. Callers pass the version they looked up under
+    to put(), so a result computed across a version change is not stored.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 86400, db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_path = db_path
+        self.version = None
+        self._entries = OrderedDict()  # key -> (created, result)
+        self._lock = threading.Lock()
+        self._conn = None
+        self.stats = {'memory_hits': 0, 'persistent_hits': 0, 'misses': 0, 'stores': 0, 'stale_puts': 0, 'evictions': 0, 'invalidations': 0}
+        if db_path:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    version TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    result TEXT NOT NULL
+                )
+            ''')
+            self._conn.commit()
+
+    def set_version(self, version: str) -> None:
+        """Invalidates every entry computed under a different version."""
+        with self._lock:
+            if version == self.version:
+                return
+            if self.version is not None:
+                self.stats['invalidations'] += 1
+                print(f"Result cache invalidated (version {self.version} -> {version}).")
+            self.version = version
+            self._entries.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM results WHERE version != ?", (version,))
+                self._conn.commit()
+
+    def get(self, key: str) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, result = entry
+                if now - created <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.stats['memory_hits'] += 1
+                    return result
+                del self._entries[key]
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT created, result FROM results WHERE key = ? AND version = ?", (key, self.version)).fetchone()
+                if row is not None and now - row[0] <= self.ttl_seconds:
+                    result = json.loads(row[1])
+                    self._remember(key, row[0], result)
+                    self.stats['persistent_hits'] += 1
+                    return result
+
+            self.stats['misses'] += 1
+            return None
+
+    def put(self, key: str, result: dict, version: str) -> None:
+        """Stores a result computed under version; dropped if the version has changed since."""
+        now = time.time()
+        result = {k: v for k, v in result.items() if k not in TRANSIENT_FIELDS}
+        with self._lock:
+            if version != self.version:
+                self.stats['stale_puts'] += 1
+                return
+            self._remember(key, now, result)
+            self.stats['stores'] += 1
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO results (key, version, created, result) VALUES (?, ?, ?, ?)",
+                    (key, self.version, now, json.dumps(result)))
+                self._conn.execute("DELETE FROM results WHERE created < ?", (now - self.ttl_seconds,))
+                self._conn.commit()
+
+    def _remember(self, key: str, created: float, result: dict) -> None:
+        self._entries[key] = (created, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def info(self) -> dict:
+        with self._lock:
+            lookups = self.stats['memory_hits'] + self.stats['persistent_hits'] + self.stats['misses']
+            hits = lookups - self.stats['misses']
+            return {
+                **self.stats,
+                'hit_rate': hits / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'persistent': self._conn is not None,
+                'version': self.version,
+            }
@@ -2,12 +2,19 @@ import os
 import sqlite3
 import time
 import argparse
+import hashlib
+import json
 import sys
 
 # Add parent directory to path to import fingerprint_engine
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 try:
-    from fingerprint_engine import FingerprintEngine
+    from fingerprint_engine import FingerprintEngine, HASH_SHA1, PEAK_STRATEGIES
+    from fingerprint_index import FingerprintIndex
+    from fingerprint_db import create_schema, get_hash_format, get_peak_strategy, peak_strategies_compatible, set_meta, migrate_to_integer
+    from fingerprint_db import get_meta, params_version, delete_files
+    from fingerprint_db import build_stop_hashes, get_stop_df, has_table, has_catalog, migrate_to_catalog, store_file, scam_type_from_path
+    import soundfile as sf
 except ImportError:
     print("Error: Could not import fingerprint_engine. Make sure you are running this from the project root or scripts directory.")
     sys.exit(1)
@@ -15,80 +22,271 @@ except ImportError:
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATASET_DIR = os.path.join(BASE_DIR, 'Dataset')
 DB_PATH = os.path.join(BASE_DIR, 'fingerprints.db')
+INDEX_PATH = os.path.join(BASE_DIR, 'fingerprints.idx')
+# File-to-scam-type mapping written by the former generate_mappings.py; read only when
+# migrating a database built before the files catalog
+LEGACY_MAPPING_PATH = os.path.join(BASE_DIR, 'scam_mapping.json')
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.flac', '.ogg')
 
 # Folders to exclude (Legitimate calls)
 EXCLUDE_FOLDERS = ['Legit_Call']
 
+# Bulk loading by --build: fingerprint rows written per transaction, the share of the
+# dataset being fingerprinted from which idx_hash is dropped during the load and rebuilt
+# once at the end, and the interval between progress lines
+BUILD_BATCH_ROWS = 500000
+BULK_LOAD_MIN_SHARE = 0.2
+PROGRESS_SECONDS = 5.0
+
 def init_db():
     conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS fingerprints (
-            hash TEXT NOT NULL,
-            file_name TEXT NOT NULL,
-            offset INTEGER NOT NULL
-        )
-    ''')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_hash ON fingerprints (hash)')
-    conn.commit()
+    # Existing databases keep the hash format they were built with; new ones use packed integers
+    create_schema(conn, get_hash_format(conn))
+    if not has_catalog(conn):
+        migrate_catalog(conn)
     return conn
 
-def build_database():
+def ensure_hash_index(conn):
+    """Recreates idx_hash if a bulk load dropped it and did not finish."""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_hash ON fingerprints (hash)")
+    conn.commit()
+
+def scan_dataset():
+    """Paths of the fraud audio files in the dataset (Legit_Call folders excluded)."""
+    paths = []
+    for root, dirs, files in os.walk(DATASET_DIR):
+        if os.path.basename(root) in EXCLUDE_FOLDERS:
+            continue
+        for file in files:
+            if file.lower().endswith(AUDIO_EXTENSIONS):
+                paths.append(os.path.join(root, file))
+    return paths
+
+def describe_file(path):
+    """(duration in seconds, SHA-256 of the content) of an audio file; duration is None if unreadable."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    try:
+        duration = sf.info(path).duration
+    except Exception:
+        duration = None
+    return duration, digest.hexdigest()
+
+def migrate_catalog(conn):
+    """
+    Moves the file names of a legacy database into the files catalog. Scam types and
+    file details come from the dataset, or from scam_mapping.json for files not in it.
+    """
+    scam_types = {}
+    if os.path.exists(LEGACY_MAPPING_PATH):
+        with open(LEGACY_MAPPING_PATH) as f:
+            scam_types.update(json.load(f))
+    paths = {os.path.basename(path): path for path in scan_dataset()}
+    scam_types.update({name: scam_type_from_path(path) for name, path in paths.items()})
+
+    print("Moving file names into the files catalog...")
+    count = migrate_to_catalog(conn, scam_types)
+    for file_id, name in conn.execute("SELECT id, name FROM files").fetchall():
+        if name in paths:
+            duration, content_sha = describe_file(paths[name])
+            conn.execute("UPDATE files SET duration = ?, content_sha = ? WHERE id = ?", (duration, content_sha, file_id))
+    conn.commit()
+    missing = conn.execute("SELECT COUNT(*) FROM files WHERE scam_type IS NULL").fetchone()[0]
+    print(f"Catalogued {count} files ({missing} without a scam type).")
+    return count
+
+def plan_build(conn, paths):
+    """
+    Compares the dataset with the build manifest.
+    Returns (files to fingerprint as {path: (size, mtime_ns, duration, content_sha)},
+    unchanged file ids, ids of files to remove, number of paths whose mtime changed
+    but whose content did not). New files are not read here; their duration and
+    content hash are None and left to the writer.
+    """
+    manifest = {path: (file_id, size, mtime_ns, content_sha) for path, file_id, size, mtime_ns, content_sha
+                in conn.execute("SELECT path, file_id, size, mtime_ns, content_sha FROM manifest")}
+    to_fingerprint, unchanged, touched = {}, set(), 0
+    for path in paths:
+        st = os.stat(path)
+        entry = manifest.get(path)
+        if entry is None:
+            to_fingerprint[path] = (st.st_size, st.st_mtime_ns, None, None)
+            continue
+        if entry[1:3] == (st.st_size, st.st_mtime_ns):
+            unchanged.add(entry[0])
+            continue
+        duration, content_sha = describe_file(path)
+        if entry[3] == content_sha:
+            # Copied or touched: same bytes, so the stored fingerprints still hold
+            conn.execute("UPDATE manifest SET size = ?, mtime_ns = ? WHERE path = ?", (st.st_size, st.st_mtime_ns, path))
+            unchanged.add(entry[0])
+            touched += 1
+            continue
+        to_fingerprint[path] = (st.st_size, st.st_mtime_ns, duration, content_sha)
+
+    # Files whose path left the dataset, and catalog rows no manifest entry accounts for
+    # (databases built before the manifest); files about to be re-fingerprinted stay
+    names = {os.path.basename(path) for path in to_fingerprint}
+    removed = [file_id for file_id, name in conn.execute("SELECT id, name FROM files")
+               if file_id not in unchanged and name not in names]
+    return to_fingerprint, unchanged, removed, touched
+
+def open_writer(conn):
+    """
+    Tunes the build connection for bulk writes: WAL journaling with synchronous=NORMAL
+    syncs only at checkpoints instead of on every commit.
+    """
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA cache_size = -262144")
+    conn.execute("PRAGMA temp_store = MEMORY")
+
+def close_writer(conn):
+    """Checkpoints the WAL back into the DB file, so readers opening it read-only see one self-contained file."""
+    conn.commit()
+    conn.execute("PRAGMA journal_mode = DELETE")
+    conn.close()
+
+def report_progress(done, total, hashes, start_time):
+    elapsed = max(time.time() - start_time, 1e-9)
+    files_per_second = done / elapsed
+    eta = (total - done) / files_per_second if files_per_second else 0.0
+    print(f"Processed {done}/{total} files: {files_per_second:.1f} files/s, {hashes / elapsed:,.0f} hashes/s, "
+          f"ETA {eta:.0f} seconds")
+
+def build_database(peak_strategy=None, workers=None):
+    """
+    Incremental build: fingerprints only files that are new or whose content changed
+    since the last build, and removes files that left the dataset. Everything is
+    rebuilt when the engine parameters differ from the ones the DB was built with.
+    Worker processes fingerprint the files while this process is the single writer,
+    committing every BUILD_BATCH_ROWS fingerprints.
+    """
+    if not os.path.exists(DATASET_DIR):
+        print(f"Dataset directory not found at {DATASET_DIR}")
+        return
     conn = init_db()
-    cursor = conn.cursor()
-    engine = FingerprintEngine()
-    
-    total_files = 0
-    processed_files = 0
-    start_time = time.time()
+    open_writer(conn)
+    hash_format = get_hash_format(conn)
+    stored_strategy = get_peak_strategy(conn)
+    peak_strategy = peak_strategy or stored_strategy
+    engine = FingerprintEngine(hash_format=hash_format, peak_strategy=peak_strategy)
+    version = params_version(engine.params())
+    print(f"Hash format: {hash_format}, peak strategy: {engine.peak_strategy}, workers: {workers or os.cpu_count()}")
 
+    # Hashes from different engine params never match, so the DB is rebuilt rather than mixed.
+    # Databases built before the manifest only record their peak strategy.
+    stored_version = get_meta(conn, 'engine_params_version')
+    has_rows = conn.execute("SELECT 1 FROM fingerprints LIMIT 1").fetchone() is not None
+    if stored_version is not None:
+        params_changed = stored_version != version
+    else:
+        params_changed = has_rows and not peak_strategies_compatible(peak_strategy, stored_strategy)
+    if params_changed:
+        print("Engine parameters changed since the last build. Rebuilding every file.")
+        for table in ('fingerprints', 'manifest', 'files'):
+            conn.execute(f"DELETE FROM {table}")
+    set_meta(conn, 'peak_strategy', peak_strategy)
+    set_meta(conn, 'engine_params_version', version)
+    conn.commit()
+
+    start_time = time.time()
     print(f"Scanning dataset at {DATASET_DIR}...")
-    
-    # 1. Count files first for progress
-    files_to_process = []
-    if os.path.exists(DATASET_DIR):
-        for root, dirs, files in os.walk(DATASET_DIR):
-            folder_name = os.path.basename(root)
-            if folder_name in EXCLUDE_FOLDERS:
+    paths = scan_dataset()
+    to_fingerprint, unchanged, removed, touched = plan_build(conn, paths)
+    print(f"Found {len(paths)} fraud audio files: {len(to_fingerprint)} new or changed, {len(unchanged)} unchanged, "
+          f"{len(removed)} to remove.")
+
+    # Old rows of changed files go in the same single pass over the table as removed files
+    names = {os.path.basename(path) for path in to_fingerprint}
+    replaced = {name: file_id for file_id, name in conn.execute("SELECT id, name FROM files") if name in names}
+    if removed:
+        delete_files(conn, removed)
+    if replaced:
+        conn.execute("DELETE FROM fingerprints WHERE file_id IN (SELECT value FROM json_each(?))",
+                     (json.dumps(list(replaced.values())),))
+    conn.commit()
+
+    # Appending to idx_hash row by row costs far more than one sorted rebuild after a large load
+    bulk_load = len(to_fingerprint) > 0 and len(to_fingerprint) >= BULK_LOAD_MIN_SHARE * len(paths)
+    processed_files = 0
+    failed_files = []
+    new_hashes = 0
+    batch_rows = 0
+    load_start = last_report = time.time()
+    try:
+        if bulk_load:
+            conn.execute("DROP INDEX IF EXISTS idx_hash")
+            conn.commit()
+        for file_path, hashes, offsets in engine.fingerprint_many(list(to_fingerprint), workers=workers, ordered=False):
+            size, mtime_ns, duration, content_sha = to_fingerprint[file_path]
+            if hashes is not None and content_sha is None:
+                try:
+                    duration, content_sha = describe_file(file_path)
+                except OSError as e:
+                    print(f"Error processing {file_path}: {e}")
+                    hashes = None
+            if hashes is None:
+                # Neither catalogued nor in the manifest, so the next build retries the file
+                failed_files.append(file_path)
+                name = os.path.basename(file_path)
+                if name in replaced:
+                    delete_files(conn, [replaced[name]])
                 continue
-                
-            for file in files:
-                if file.lower().endswith(('.wav', '.mp3', '.flac', '.ogg')):
-                    files_to_process.append(os.path.join(root, file))
-    else:
-        print(f"Dataset directory not found at {DATASET_DIR}")
-        return
+            # The catalog row carries the scam type (the file's folder)
+            file_id = store_file(conn, os.path.basename(file_path), hashes, offsets, scam_type=scam_type_from_path(file_path),
+                                 duration=duration, content_sha=content_sha, replace=False)
+            conn.execute("INSERT OR REPLACE INTO manifest (path, file_id, size, mtime_ns, content_sha) VALUES (?, ?, ?, ?, ?)",
+                         (file_path, file_id, size, mtime_ns, content_sha))
 
-    total_files = len(files_to_process)
-    print(f"Found {total_files} fraud audio files to process.")
-
-    # 2. Process files
-    for file_path in files_to_process:
-        try:
-            filename = os.path.basename(file_path)
-            # Check if already processed (simple check, can be improved)
-            # For now, we assume we want to rebuild or append. 
-            # To avoid duplicates if re-running, we could delete existing entries for this file.
-            cursor.execute("DELETE FROM fingerprints WHERE file_name = ?", (filename,))
-            
-            hashes = engine.fingerprint_file(file_path)
-            
-            if hashes:
-                # Batch insert
-                data_to_insert = [(h, filename, offset) for h, offset in hashes]
-                cursor.executemany("INSERT INTO fingerprints (hash, file_name, offset) VALUES (?, ?, ?)", data_to_insert)
-                conn.commit()
-            
             processed_files += 1
-            if processed_files % 10 == 0:
-                print(f"Processed {processed_files}/{total_files} files...")
-                
-        except Exception as e:
-            print(f"Error processing {file_path}: {e}")
+            new_hashes += len(hashes)
+            batch_rows += len(hashes)
+            if batch_rows >= BUILD_BATCH_ROWS:
+                conn.commit()
+                batch_rows = 0
+            if time.time() - last_report >= PROGRESS_SECONDS:
+                report_progress(processed_files, len(to_fingerprint), new_hashes, load_start)
+                last_report = time.time()
+        conn.commit()
+    finally:
+        if bulk_load:
+            # Also after an interrupted load: the uncommitted batch is rolled back and the
+            # committed ones stay queryable. A run killed outright is repaired by init_db.
+            conn.rollback()
+            index_start = time.time()
+            print("Rebuilding the hash index...")
+            ensure_hash_index(conn)
+            print(f"Hash index rebuilt in {time.time() - index_start:.2f} seconds.")
+    if processed_files:
+        report_progress(processed_files, len(to_fingerprint), new_hashes, load_start)
 
-    conn.close()
+    changed = processed_files > 0 or bool(removed) or any(os.path.basename(path) in replaced for path in failed_files)
+    if changed or not has_table(conn, 'stop_hashes'):
+        stop_df = build_stop_hashes(conn)
+        stop_count = conn.execute("SELECT COUNT(*) FROM stop_hashes").fetchone()[0]
+        print(f"Marked {stop_count} stop hashes (present in {stop_df}+ files).")
+
+    skipped_hashes, skipped_seconds = conn.execute(
+        "SELECT COALESCE(SUM(n_hashes), 0), COALESCE(SUM(duration), 0) FROM files WHERE id IN (SELECT value FROM json_each(?))",
+        (json.dumps(sorted(unchanged)),)).fetchone()
+    close_writer(conn)
     elapsed = time.time() - start_time
-    print(f"Database build complete. Processed {processed_files} files in {elapsed:.2f} seconds.")
+    print(f"Database build complete in {elapsed:.2f} seconds.")
+    print(f"  Fingerprinted: {processed_files} files ({new_hashes} hashes)")
+    print(f"  Skipped:       {len(unchanged)} unchanged files ({skipped_hashes} hashes, {skipped_seconds / 60:.1f} minutes of audio), "
+          f"{touched} of them re-hashed after an mtime change")
+    print(f"  Removed:       {len(removed)} files no longer in the dataset")
+    if failed_files:
+        print(f"  Failed:        {len(failed_files)} files could not be decoded and will be retried by the next build:")
+        for path in failed_files:
+            print(f"    {path}")
+    if changed or not os.path.exists(INDEX_PATH):
+        export_index()
+    else:
+        print(f"Nothing changed; {INDEX_PATH} is up to date.")
 
 def check_database():
     if not os.path.exists(DB_PATH):
@@ -97,32 +295,150 @@ def check_database():
 
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
+    print(f"Hash format: {get_hash_format(conn)}, peak strategy: {get_peak_strategy(conn)}")
     cursor.execute("SELECT COUNT(*) FROM fingerprints")
     count = cursor.fetchone()[0]
     print(f"Total fingerprints: {count}")
     
-    cursor.execute("SELECT COUNT(DISTINCT file_name) FROM fingerprints")
-    file_count = cursor.fetchone()[0]
-    print(f"Distinct files indexed: {file_count}")
-    
-    cursor.execute("SELECT file_name FROM fingerprints LIMIT 5")
+    if not has_catalog(conn):
+        print("No files catalog (built before it existed). Run --migrate.")
+        conn.close()
+        return
+
+    cursor.execute("SELECT COUNT(*), COALESCE(SUM(duration), 0) FROM files")
+    file_count, total_duration = cursor.fetchone()
+    print(f"Files in catalog: {file_count} ({total_duration / 3600:.1f} hours of audio)")
+
+    cursor.execute("SELECT scam_type, COUNT(*) FROM files GROUP BY scam_type ORDER BY COUNT(*) DESC")
+    print("Files per scam type:")
+    for scam_type, count in cursor.fetchall():
+        print(f"  {scam_type or 'Unknown'}: {count}")
+
+    cursor.execute("SELECT name FROM files ORDER BY id LIMIT 5")
     rows = cursor.fetchall()
     print("Sample files:", [r[0] for r in rows])
     
     conn.close()
 
+def hash_stats():
+    """Reports per-hash document frequency and what stop-hash pruning saves."""
+    if not os.path.exists(DB_PATH):
+        print("Database not found!")
+        return
+
+    conn = sqlite3.connect(DB_PATH)
+    file_column = 'file_id' if has_catalog(conn) else 'file_name'
+    if not has_table(conn, 'stop_hashes'):
+        print("Computing stop hashes...")
+        build_stop_hashes(conn)
+    stop_df = get_stop_df(conn)
+
+    # Per-hash row count (rf) and document frequency (df)
+    conn.execute(f'''
+        CREATE TEMP TABLE hash_freq AS
+        SELECT hash, COUNT(*) AS rf, COUNT(DISTINCT {file_column}) AS df FROM fingerprints GROUP BY hash
+    ''')
+    total_rows, distinct_hashes, rf_squares = conn.execute(
+        "SELECT SUM(rf), COUNT(*), SUM(rf * rf) FROM hash_freq").fetchone()
+    num_files = conn.execute(f"SELECT COUNT(DISTINCT {file_column}) FROM fingerprints").fetchone()[0]
+    stop_hashes, stop_rows, stop_rf_squares = conn.execute(
+        "SELECT COUNT(*), COALESCE(SUM(rf), 0), COALESCE(SUM(rf * rf), 0) FROM hash_freq WHERE df >= ?", (stop_df,)).fetchone()
+
+    print(f"Files: {num_files}, fingerprints: {total_rows}, distinct hashes: {distinct_hashes}")
+    print(f"Stop-hash threshold: present in {stop_df}+ files")
+    print(f"Stop hashes: {stop_hashes} ({stop_hashes / max(distinct_hashes, 1):.2%} of distinct hashes, "
+          f"{stop_rows / max(total_rows, 1):.2%} of rows)")
+    # A query hash drawn from the indexed audio hits a hash in proportion to its row count and
+    # returns rf rows, so the expected rows fetched per query hash scale with sum(rf^2).
+    print(f"Expected matched rows per query removed by pruning: {stop_rf_squares / max(rf_squares or 0, 1):.2%}")
+
+    print("\nDocument frequency distribution:")
+    buckets = [(1, 1), (2, 4), (5, 9), (10, 49), (50, 199), (200, None)]
+    for low, high in buckets:
+        if high is None:
+            count = conn.execute("SELECT COUNT(*) FROM hash_freq WHERE df >= ?", (low,)).fetchone()[0]
+            label = f"{low}+"
+        else:
+            count = conn.execute("SELECT COUNT(*) FROM hash_freq WHERE df BETWEEN ? AND ?", (low, high)).fetchone()[0]
+            label = f"{low}-{high}" if low != high else f"{low}"
+        print(f"  df {label:>8}: {count}")
+
+    rows = conn.execute("SELECT hash, df, rf FROM hash_freq ORDER BY df DESC, rf DESC LIMIT 10").fetchall()
+    print("\nMost common hashes (hash, files, rows):")
+    for h, df, rf in rows:
+        print(f"  {h}  {df}  {rf}")
+    conn.close()
+
+def export_index(index_path=None):
+    """Writes the memory-mappable index file the API server loads at startup."""
+    index_path = index_path or INDEX_PATH
+    if not os.path.exists(DB_PATH):
+        print("Database not found!")
+        return
+
+    start_time = time.time()
+    index = FingerprintIndex.from_sqlite(DB_PATH)
+    index.save(index_path)
+    elapsed = time.time() - start_time
+    size = os.path.getsize(index_path)
+    print(f"Exported {len(index)} fingerprints from {index.num_files} files to {index_path} "
+          f"({size / 1e6:.1f} MB) in {elapsed:.2f} seconds.")
+
+def migrate_database():
+    if not os.path.exists(DB_PATH):
+        print("Database not found!")
+        return
+
+    conn = sqlite3.connect(DB_PATH)
+    if has_table(conn, 'fingerprints'):
+        ensure_hash_index(conn)
+    legacy_hashes = get_hash_format(conn) == HASH_SHA1
+    if not legacy_hashes and has_catalog(conn):
+        print(f"Database already uses integer hashes ({get_hash_format(conn)}) and a files catalog. Nothing to do.")
+        conn.close()
+        return
+
+    size_before = os.path.getsize(DB_PATH)
+    start_time = time.time()
+    count = conn.execute("SELECT COUNT(*) FROM fingerprints").fetchone()[0]
+    if legacy_hashes:
+        print("Converting TEXT hashes to INTEGER keys...")
+        migrate_to_integer(conn)
+    if not has_catalog(conn):
+        migrate_catalog(conn)
+    build_stop_hashes(conn)
+    print("Reclaiming space...")
+    conn.execute("VACUUM")
+    conn.close()
+    size_after = os.path.getsize(DB_PATH)
+    elapsed = time.time() - start_time
+    print(f"Migrated {count} fingerprints in {elapsed:.2f} seconds.")
+    print(f"Database size: {size_before / 1e6:.1f} MB -> {size_after / 1e6:.1f} MB")
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Tools for managing the fingerprint database.")
-    parser.add_argument('--build', action='store_true', help='Build or update the database from the dataset.')
+    parser.add_argument('--build', action='store_true', help='Build or update the database from the dataset (only new or changed files are fingerprinted).')
     parser.add_argument('--check', action='store_true', help='Check database statistics.')
+    parser.add_argument('--peaks', choices=PEAK_STRATEGIES, help='Peak picking strategy used by --build (defaults to the one the DB was built with).')
+    parser.add_argument('--workers', type=int, default=None, help='Fingerprinting processes used by --build (default: all CPUs); this process writes to the DB.')
+    parser.add_argument('--stats', action='store_true', help='Report hash document frequency and stop-hash pruning savings.')
+    parser.add_argument('--export-index', nargs='?', const=INDEX_PATH, metavar='PATH', help='Export the memory-mapped index file used by the API (default: fingerprints.idx).')
+    parser.add_argument('--migrate', action='store_true', help='Convert a legacy database to INTEGER hashes and the files catalog.')
     
     args = parser.parse_args()
     
     if args.build:
         if os.path.exists(DB_PATH):
             print(f"Database already exists at {DB_PATH}. It will be updated.")
-        build_database()
+        build_database(peak_strategy=args.peaks, workers=args.workers)
     elif args.check:
         check_database()
+    elif args.migrate:
+        migrate_database()
+        export_index()
+    elif args.stats:
+        hash_stats()
+    elif args.export_index:
+        export_index(args.export_index)
     else:
         parser.print_help()
@@ -163,6 +163,584 @@ def test_accuracy(limit=20):
     with open("accuracy_report.txt", "w") as f:
         f.write(report)
 
+# --- PEAK PICKING BENCHMARK ---
+def get_corpus_files(limit=None):
+    """Lists audio files under Dataset/Data (all categories)."""
+    data_dir = os.path.join(DATASET_DIR, 'Data')
+    files = []
+    for root, dirs, names in os.walk(data_dir):
+        for name in names:
+            if name.lower().endswith(('.mp3', '.wav')):
+                files.append(os.path.join(root, name))
+    files.sort()
+    if limit and len(files) > limit:
+        files = random.sample(files, limit)
+    return files
+
+def best_match(index, hashes):
+    votes = defaultdict(int)
+    for h in hashes.tolist():
+        for name in index.get(h, ()):
+            votes[name] += 1
+    return max(votes, key=votes.get) if votes else None
+
+def bench_peaks(strategies, limit=50, excerpt_seconds=5.0, snr_db=20.0, seed=0):
+    from fingerprint_engine import FingerprintEngine, PEAKS_DIAMOND
+
+    files = get_corpus_files(limit)
+    if not files:
+        print(f"No audio files found under {os.path.join(DATASET_DIR, 'Data')}")
+        return
+    if PEAKS_DIAMOND not in strategies:
+        strategies = [PEAKS_DIAMOND] + list(strategies)
+
+    rng = np.random.default_rng(seed)
+    base = FingerprintEngine()
+    print(f"Decoding {len(files)} files...")
+    clips = []
+    for path in files:
+        y = base.load_audio(path)
+        if len(y) == 0:
+            continue
+        # Noisy excerpt used as the query
+        n = min(len(y), int(excerpt_seconds * base.sampling_rate))
+        start = int(rng.integers(0, len(y) - n + 1))
+        excerpt = y[start:start + n]
+        noise_power = np.mean(excerpt ** 2) / (10 ** (snr_db / 10)) if n else 0.0
+        excerpt = excerpt + rng.normal(0, np.sqrt(noise_power), n).astype(np.float32)
+        clips.append((os.path.basename(path), base._get_spectrogram(y), base._get_spectrogram(excerpt), len(y)))
+    total_seconds = sum(c[3] for c in clips) / base.sampling_rate
+
+    results = {}
+    for strategy in strategies:
+        engine = FingerprintEngine(peak_strategy=strategy)
+        engine.find_peak_arrays(clips[0][1])  # warm-up (JIT compilation)
+
+        index = defaultdict(set)
+        peak_time = 0.0
+        peak_count = 0
+        for name, S, _, _ in clips:
+            t0 = time.perf_counter()
+            freqs, times = engine.find_peak_arrays(S)
+            peak_time += time.perf_counter() - t0
+            peak_count += len(freqs)
+            hashes, _ = engine._encode_hashes(*engine._pair_sorted_peaks(freqs, times))
+            for h in hashes.tolist():
+                index[h].add(name)
+
+        correct = 0
+        for name, _, S_query, _ in clips:
+            freqs, times = engine.find_peak_arrays(S_query)
+            hashes, _ = engine._encode_hashes(*engine._pair_sorted_peaks(freqs, times))
+            if best_match(index, hashes) == name:
+                correct += 1
+        results[strategy] = (peak_time, peak_count, correct / len(clips))
+
+    baseline_time, _, baseline_recall = results[PEAKS_DIAMOND]
+    print(f"\nPeak picking on {len(clips)} files ({total_seconds:.0f}s of audio), "
+          f"queries: {excerpt_seconds:.0f}s excerpts at {snr_db:.0f} dB SNR")
+    print(f"{'strategy':<12}{'time (s)':>10}{'speedup':>10}{'peaks/s':>10}{'recall':>10}{'delta':>10}")
+    for strategy, (peak_time, peak_count, recall) in results.items():
+        speedup = baseline_time / peak_time if peak_time > 0 else float('inf')
+        print(f"{strategy:<12}{peak_time:>10.3f}{speedup:>9.1f}x{peak_count / total_seconds:>10.1f}"
+              f"{recall:>10.1%}{recall - baseline_recall:>+10.1%}")
+
+# --- SPECTRAL FRONT END CHECK ---
+def check_frontend(limit=20, tolerance_db=1e-3):
+    """
+    Checks that the shared STFT front end reproduces the separate fingerprint and
+    mel pipelines, and reports the time saved.
+    """
+    from fingerprint_engine import FingerprintEngine
+    from audio_features import AudioContext, preprocess_waveform, shared_features
+
+    files = get_corpus_files(limit)
+    if not files:
+        print(f"No audio files found under {os.path.join(DATASET_DIR, 'Data')}")
+        return
+    engine = FingerprintEngine()
+    separate_time = 0.0
+    shared_time = 0.0
+    worst_db = 0.0
+    failures = 0
+    for path in files:
+        y = AudioContext.from_file(path).samples
+        if len(y) == 0:
+            continue
+        t0 = time.perf_counter()
+        hashes, offsets = engine.fingerprint_waveform(y)
+        mel = preprocess_waveform(y)
+        t1 = time.perf_counter()
+        shared_hashes, shared_offsets, shared_mel = shared_features(engine, y)
+        t2 = time.perf_counter()
+        separate_time += t1 - t0
+        shared_time += t2 - t1
+
+        same_hashes = np.array_equal(hashes, shared_hashes) and np.array_equal(offsets, shared_offsets)
+        diff_db = float(np.max(np.abs(mel - shared_mel))) if mel is not None and shared_mel is not None else float('inf')
+        worst_db = max(worst_db, diff_db)
+        if not same_hashes or diff_db > tolerance_db:
+            failures += 1
+            print(f"[MISMATCH] {os.path.basename(path)}: hashes equal={same_hashes}, max mel diff={diff_db:.2e} dB")
+
+    print(f"\nShared STFT front end on {len(files)} files")
+    print(f"Separate: {separate_time:.2f}s, shared: {shared_time:.2f}s "
+          f"({separate_time / shared_time if shared_time > 0 else float('inf'):.2f}x)")
+    print(f"Max log-mel difference: {worst_db:.2e} dB (tolerance {tolerance_db:.0e})")
+    print("PASS" if failures == 0 else f"FAIL ({failures} files)")
+
+# --- STREAMING PARITY CHECK ---
+def check_stream(limit=20, runs=2, min_overlap=0.99):
+    """
+    Checks that fingerprint_stream (used for long uploads) reproduces fingerprint_arrays
+    on corpus files, and gives the same hashes on every run.
+    """
+    from fingerprint_engine import FingerprintEngine
+
+    files = get_corpus_files(limit)
+    if not files:
+        print(f"No audio files found under {os.path.join(DATASET_DIR, 'Data')}")
+        return
+    engine = FingerprintEngine()
+    failures = 0
+    worst = 1.0
+    for path in files:
+        hashes, offsets = engine.fingerprint_arrays(path)
+        expected = set(zip(hashes.tolist(), offsets.tolist()))
+        streamed = []
+        for _ in range(runs):
+            pairs = set()
+            for block_hashes, block_offsets in engine.fingerprint_stream(path):
+                pairs.update(zip(block_hashes.tolist(), block_offsets.tolist()))
+            streamed.append(pairs)
+        overlap = len(expected & streamed[0]) / max(len(expected | streamed[0]), 1)
+        stable = all(pairs == streamed[0] for pairs in streamed[1:])
+        worst = min(worst, overlap)
+        if overlap < min_overlap or not stable:
+            failures += 1
+            print(f"[MISMATCH] {os.path.basename(path)}: {len(expected)} hashes in full, "
+                  f"{[len(pairs) for pairs in streamed]} streamed, overlap {overlap:.2%}, stable across runs={stable}")
+
+    print(f"\nStreaming vs. full fingerprinting on {len(files)} files")
+    print(f"Lowest overlap: {worst:.2%} (minimum {min_overlap:.0%})")
+    print("PASS" if failures == 0 else f"FAIL ({failures} files)")
+
+# --- LEGACY DB CHECK ---
+def write_legacy_db(db_path, files):
+    """
+    Writes files the way the original db_tools --build did: TEXT SHA-1 hashes, file
+    names and numpy int64 offsets bound as-is (stored as 8-byte BLOBs).
+    Returns {file name: set of (64-bit hash prefix, offset)}.
+    """
+    import sqlite3
+    from fingerprint_engine import FingerprintEngine, HASH_SHA1, sha1_to_int64
+
+    engine = FingerprintEngine(hash_format=HASH_SHA1)
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE fingerprints (hash TEXT NOT NULL, file_name TEXT NOT NULL, offset INTEGER NOT NULL)")
+    conn.execute("CREATE INDEX idx_hash ON fingerprints (hash)")
+    expected = {}
+    for path in files:
+        name = os.path.basename(path)
+        hashes, offsets = engine.fingerprint_arrays(path)
+        conn.executemany("INSERT INTO fingerprints (hash, file_name, offset) VALUES (?, ?, ?)",
+                         [(h, name, offset) for h, offset in zip(hashes.tolist(), offsets)])
+        expected[name] = {(sha1_to_int64(h), o) for h, o in zip(hashes.tolist(), offsets.tolist())}
+    conn.commit()
+    conn.close()
+    return expected
+
+def index_rows(index):
+    """{file name: set of (hash, offset)} of a FingerprintIndex."""
+    rows = defaultdict(set)
+    for h, file_id, offset in zip(index.keys.tolist(), index.file_ids.tolist(), index.offsets.tolist()):
+        rows[index.file_names[file_id]].add((h, offset))
+    return rows
+
+def check_legacy_db(limit=5):
+    """
+    Checks that a DB written by the original build tool is served as it is, and
+    that it migrates to INTEGER hashes and the files catalog with its offsets
+    intact and exports to an index.
+    """
+    import shutil
+    import sqlite3
+    import tempfile
+    from fingerprint_db import migrate_to_integer, migrate_to_catalog
+    from fingerprint_index import FingerprintIndex, IndexHolder
+
+    files = get_corpus_files(limit)
+    if not files:
+        print(f"No audio files found under {os.path.join(DATASET_DIR, 'Data')}")
+        return
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, 'legacy.db')
+        expected = write_legacy_db(legacy_path, files)
+        conn = sqlite3.connect(legacy_path)
+        blobs = conn.execute("SELECT COUNT(*) FROM fingerprints WHERE typeof(offset) = 'blob'").fetchone()[0]
+        conn.close()
+        print(f"Legacy DB: {sum(map(len, expected.values()))} distinct rows from {len(files)} files, {blobs} BLOB offsets")
+
+        try:
+            _, index = IndexHolder(legacy_path).get()
+            rows = index_rows(index)
+        except Exception as e:
+            failures += 1
+            print(f"[ERROR] loading the unmigrated DB: {e}")
+            rows = {}
+        for name, pairs in expected.items():
+            if rows.get(name, set()) != pairs:
+                failures += 1
+                print(f"[MISMATCH] {name}: {len(pairs)} rows written, {len(rows.get(name, ()))} loaded unmigrated")
+
+        migrated_path = os.path.join(tmp, 'migrated.db')
+        shutil.copy(legacy_path, migrated_path)
+        conn = sqlite3.connect(migrated_path)
+        migrate_to_integer(conn)
+        migrate_to_catalog(conn)
+        types = dict(conn.execute("SELECT typeof(offset), COUNT(*) FROM fingerprints GROUP BY 1").fetchall())
+        conn.close()
+        if set(types) != {'integer'}:
+            failures += 1
+            print(f"[MISMATCH] migrated offset types: {types}")
+        try:
+            rows = index_rows(FingerprintIndex.from_sqlite(migrated_path))
+        except Exception as e:
+            failures += 1
+            print(f"[ERROR] export after migration: {e}")
+            rows = {}
+        for name, pairs in expected.items():
+            if rows.get(name, set()) != pairs:
+                failures += 1
+                print(f"[MISMATCH] {name}: {len(pairs)} rows written, {len(rows.get(name, ()))} after migration")
+
+    print("PASS" if failures == 0 else f"FAIL ({failures} checks)")
+
+# --- COMPRESSED UPLOAD CHECK ---
+def check_decode(file_path=None, seconds=10.0):
+    """
+    Checks that an m4a (AAC) upload decodes through AudioContext's librosa/audioread
+    fallback to about the same length as the source, and that bytes no decoder
+    accepts raise AudioDecodeError. Without --file, a corpus excerpt is encoded to
+    m4a with ffmpeg, which the fallback needs anyway.
+    """
+    import shutil
+    import subprocess
+    import tempfile
+    from audio_features import AudioContext, AudioDecodeError, SAMPLE_RATE
+
+    failures = 0
+    expected_seconds = None
+    if file_path is None:
+        source = next(iter(get_corpus_files(1)), None)
+        if shutil.which("ffmpeg") is None or source is None:
+            print("ffmpeg not found on PATH (or no corpus file): m4a/aac/webm uploads cannot be decoded here.")
+            print("FAIL (1 checks)")
+            return
+        expected_seconds = min(AudioContext.from_file(source).duration, seconds)
+        with tempfile.TemporaryDirectory() as tmp:
+            file_path = os.path.join(tmp, 'excerpt.m4a')
+            subprocess.run(["ffmpeg", "-loglevel", "error", "-y", "-i", source, "-t", str(seconds), "-c:a", "aac", file_path], check=True)
+            audio = AudioContext.from_file(file_path)
+    else:
+        audio = AudioContext.from_file(file_path)
+
+    try:
+        decoded_seconds = len(audio.samples) / SAMPLE_RATE
+        print(f"{os.path.basename(file_path)}: {decoded_seconds:.2f}s decoded")
+        if decoded_seconds == 0 or (expected_seconds is not None and abs(decoded_seconds - expected_seconds) > 0.1):
+            failures += 1
+            print(f"[MISMATCH] expected {expected_seconds or 'non-empty'} seconds")
+    except AudioDecodeError as e:
+        failures += 1
+        print(f"[ERROR] {e}")
+
+    try:
+        AudioContext(b"not audio at all", "garbage.m4a").samples
+        failures += 1
+        print("[MISMATCH] undecodable bytes did not raise AudioDecodeError")
+    except AudioDecodeError:
+        pass
+
+    print("PASS" if failures == 0 else f"FAIL ({failures} checks)")
+
+# --- COLD START BENCHMARK ---
+def bench_coldstart(file_path=None, port=8012, timeout=300.0):
+    """
+    Starts the API in a fresh uvicorn process and reports the seconds until the first
+    successful fingerprint response, the first hybrid response and /ready.
+    """
+    import subprocess
+
+    file_path = file_path or next(iter(get_corpus_files(1)), None)
+    if not file_path or not os.path.exists(file_path):
+        print("No audio file to send; pass one with --file.")
+        return
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import app"], cwd=BASE_DIR, capture_output=True)
+    import_seconds = time.perf_counter() - start
+
+    url = f"http://127.0.0.1:{port}"
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "app:app", "--port", str(port)],
+                              cwd=BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    start = time.perf_counter()
+    timings = {}
+    try:
+        def post(mode):
+            files = {'file': (os.path.basename(file_path), data)}
+            res = requests.post(f"{url}/predict", files=files, data={'mode': mode, 'manual_transcript': 'cold start'}, timeout=timeout)
+            body = res.json() if res.status_code == 200 else {}
+            return body.get('label') not in (None, 'ERROR') and 'not loaded' not in body.get('details', '')
+
+        while time.perf_counter() - start < timeout and len(timings) < 3:
+            try:
+                if 'fingerprint' not in timings and post('fingerprint'):
+                    timings['fingerprint'] = time.perf_counter() - start
+                if 'fingerprint' in timings and 'hybrid' not in timings and post('hybrid'):
+                    timings['hybrid'] = time.perf_counter() - start
+                if 'ready' not in timings and requests.get(f"{url}/ready", timeout=5).status_code == 200:
+                    timings['ready'] = time.perf_counter() - start
+            except requests.exceptions.ConnectionError:
+                pass
+            time.sleep(0.1)
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"\nCold start ({os.path.basename(file_path)})")
+    print(f"import app:                {import_seconds:8.2f}s")
+    for name, label in [('fingerprint', 'first fingerprint response'), ('hybrid', 'first hybrid response'), ('ready', '/ready healthy')]:
+        value = f"{timings[name]:8.2f}s" if name in timings else "   timeout"
+        print(f"{label + ':':<27}{value}")
+
+# --- INFERENCE BATCHING BENCHMARK ---
+def bench_batching(batch_sizes, n_requests=64, max_wait_ms=10.0, model_path=None):
+    """
+    Hybrid model throughput through InferenceBatcher: n_requests concurrent
+    predict() calls per max batch size, with max batch size 1 as the baseline.
+    """
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+    os.environ.setdefault('TF_ENABLE_ONEDNN_OPTS', '0')
+    import tensorflow as tf
+    from audio_features import N_MELS, FIXED_LENGTH
+    from inference_batcher import InferenceBatcher
+
+    model_path = model_path or os.path.join(DATASET_DIR, 'hybrid_audio_text_model_v6.keras')
+    print(f"Loading {model_path}...")
+    model = tf.keras.models.load_model(model_path)
+
+    def predict_batch(audio_batch, transcripts):
+        prediction = model.predict([audio_batch, tf.constant(transcripts)], batch_size=len(transcripts), verbose=0)
+        return prediction[:, 0]
+
+    frames = 1 + FIXED_LENGTH // 512
+    rng = np.random.default_rng(0)
+    mels = rng.uniform(-80, 0, (n_requests, N_MELS, frames, 1)).astype(np.float32)
+    transcripts = [f"please confirm the one time password number {i}" for i in range(n_requests)]
+
+    async def run(batcher):
+        return await asyncio.gather(*(batcher.predict(mels[i:i + 1], transcripts[i]) for i in range(n_requests)))
+
+    print(f"\n{n_requests} concurrent requests on ({N_MELS}, {frames}) mel inputs, max wait {max_wait_ms:g} ms")
+    print(f"{'batch':>8}{'time (s)':>10}{'req/s':>10}{'speedup':>10}{'avg fill':>10}")
+    baseline = None
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        for batch_size in sorted(set([1] + list(batch_sizes))):
+            predict_batch(mels[:batch_size], transcripts[:batch_size])  # warm-up
+            batcher = InferenceBatcher(predict_batch, batch_size, max_wait_ms, executor)
+            t0 = time.perf_counter()
+            asyncio.run(run(batcher))
+            elapsed = time.perf_counter() - t0
+            baseline = baseline or elapsed
+            fill = batcher.info()['avg_batch_fill']
+            print(f"{batch_size:>8}{elapsed:>10.2f}{n_requests / elapsed:>10.1f}{baseline / elapsed:>9.1f}x{fill:>10.0%}")
+
+
+# --- MATCH SESSION BENCHMARK ---
+def bench_match(index_path, db_path, sizes, repeat=3, max_ratio=5.0):
+    """
+    Chunked MatchSession voting vs. one vote over the whole query, on unmatched
+    queries (random stored hashes at random offsets), where early stop never fires
+    and every chunk is voted. Fails when chunking costs more than max_ratio times
+    the one-shot vote at any size, i.e. when voting stops scaling with query length.
+    """
+    from fingerprint_index import FingerprintIndex, MatchSession
+
+    index = FingerprintIndex.load(index_path) if os.path.exists(index_path) else FingerprintIndex.from_sqlite(db_path)
+    if len(index) == 0:
+        print("The fingerprint index is empty.")
+        return
+    rng = np.random.default_rng(0)
+    failures = 0
+    print(f"{'hashes':>8}{'chunked (ms)':>14}{'one-shot (ms)':>15}{'ratio':>8}  same best")
+    for size in sizes:
+        hashes = index.keys[rng.integers(0, len(index), size)]
+        offsets = rng.integers(0, 20000, size)
+        chunked_times, one_shot_times = [], []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            chunked = MatchSession(index, stop_weight=float('inf'))
+            chunked.add(hashes, offsets)
+            chunked_times.append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            one_shot = MatchSession(index, chunk_size=size)
+            one_shot.add(hashes, offsets)
+            one_shot_times.append(time.perf_counter() - t0)
+        chunked_ms, one_shot_ms = 1000 * np.median(chunked_times), 1000 * np.median(one_shot_times)
+        ratio = chunked_ms / one_shot_ms
+        same = chunked.best()[:2] == one_shot.best()[:2]
+        if ratio > max_ratio or not same:
+            failures += 1
+        print(f"{size:>8}{chunked_ms:>14.1f}{one_shot_ms:>15.1f}{ratio:>7.1f}x  {same}")
+    print(f"\nMaximum ratio: {max_ratio:g}x")
+    print("PASS" if failures == 0 else f"FAIL ({failures} sizes)")
+
+# --- SQL LOOKUP BENCHMARK ---
+def chunked_lookup(conn, hashes, offsets, chunk_size=500):
+    """
+    The stage 1 lookup the set-based statement replaced: the query hashes in order,
+    duplicates included, as IN (...) lists of chunk_size padded to full length,
+    every returned row paired with each query position holding its hash and the
+    votes binned in numpy. Rows fetched again by a later chunk are dropped before
+    voting, so the best bin is comparable with the set-based one.
+    """
+    placeholders = ','.join(['?'] * chunk_size)
+    sql = f"SELECT hash, file_id, offset FROM fingerprints WHERE hash IN ({placeholders})"
+    rows = []
+    for start in range(0, len(hashes), chunk_size):
+        chunk = hashes[start:start + chunk_size].tolist()
+        chunk += chunk[:1] * (chunk_size - len(chunk))
+        rows.extend(conn.execute(sql, chunk).fetchall())
+    if not rows:
+        return None, 0, 0
+    rows_fetched = len(rows)
+    hit_hashes, file_ids, db_offsets = np.unique(np.array(rows, dtype=np.int64), axis=0).T
+
+    order = np.argsort(hashes, kind='stable')
+    sorted_hashes = hashes[order]
+    left = np.searchsorted(sorted_hashes, hit_hashes, side='left')
+    counts = np.searchsorted(sorted_hashes, hit_hashes, side='right') - left
+    hit_rows = np.repeat(np.arange(len(hit_hashes)), counts)
+    run_offsets = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+    query_positions = order[np.repeat(left, counts) + run_offsets]
+
+    deltas = db_offsets[hit_rows] - offsets[query_positions]
+    bins, hits = np.unique(np.column_stack([file_ids[hit_rows], deltas]), axis=0, return_counts=True)
+    best = int(np.argmax(hits))
+    return int(bins[best, 0]), int(hits[best]), rows_fetched
+
+def bench_sql_lookup(db_path, sizes, repeat=3):
+    """
+    The padded IN-list lookups the sqlite backend used to run vs. its set-based
+    single statement (SQLiteIndex.lookup_votes), on the same queries.
+    """
+    from fingerprint_index import SQLiteIndex
+
+    index = SQLiteIndex(db_path, pool_size=1)
+    rng = np.random.default_rng(0)
+    with index.pool.connection() as conn:
+        max_rowid = conn.execute("SELECT MAX(rowid) FROM fingerprints").fetchone()[0] or 0
+    if not max_rowid:
+        print("The fingerprint DB is empty.")
+        return
+
+    print(f"{'hashes':>8}{'chunked (ms)':>14}{'set-based (ms)':>16}{'speedup':>9}{'rows in':>10}{'rows out':>10}  same best hits")
+    for size in sizes:
+        # A query made of stored (hash, offset) pairs, shifted as if the call started later
+        with index.pool.connection() as conn:
+            rowids = rng.integers(1, max_rowid + 1, size).tolist()
+            pairs = []
+            for start in range(0, len(rowids), 500):
+                chunk = rowids[start:start + 500]
+                placeholders = ','.join(['?'] * len(chunk))
+                pairs += conn.execute(f"SELECT hash, offset FROM fingerprints WHERE rowid IN ({placeholders})", chunk).fetchall()
+        pairs = [pairs[i] for i in rng.integers(0, len(pairs), size)]  # duplicates, as in real queries
+        hashes = np.array([h for h, _ in pairs], dtype=np.int64)
+        offsets = np.array([o for _, o in pairs], dtype=np.int64) - 100
+
+        chunked_times, set_times = [], []
+        for _ in range(repeat):
+            with index.pool.connection() as conn:
+                t0 = time.perf_counter()
+                _, chunked_hits, rows_in = chunked_lookup(conn, hashes, offsets)
+                chunked_times.append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            file_ids, deltas, hits = index.lookup_votes(hashes, offsets)
+            set_times.append(time.perf_counter() - t0)
+        set_hits = int(hits.max()) if len(hits) else 0
+        chunked_ms, set_ms = 1000 * np.median(chunked_times), 1000 * np.median(set_times)
+        # Ties between files may resolve differently; the best bin's size must agree
+        same = chunked_hits == set_hits
+        print(f"{size:>8}{chunked_ms:>14.1f}{set_ms:>16.1f}{chunked_ms / set_ms:>8.1f}x{rows_in:>10}{len(hits):>10}  {same}")
+
+# --- LIVE CALL REPLAY ---
+def live_replay(file_path=None, sample_rate=16000, chunk_ms=100, speed=1.0, transcript=None):
+    """
+    Plays a recording into /ws/live as a live call: 16-bit PCM chunks at real-time pace
+    (speed > 1 replays faster, 0 as fast as possible). Prints every server message
+    with the call time at which it arrived.
+    """
+    import asyncio
+    import json
+    import librosa
+    try:
+        import websockets
+    except ImportError:
+        print("The websockets package is required (pip install websockets).")
+        return
+
+    file_path = file_path or next(iter(get_corpus_files(1)), None)
+    if not file_path or not os.path.exists(file_path):
+        print("No audio file to replay; pass one with --file.")
+        return
+    y, _ = librosa.load(file_path, sr=sample_rate)
+    pcm = (np.clip(y, -1.0, 1.0) * 32767).astype('<i2').tobytes()
+    chunk_bytes = max(int(sample_rate * chunk_ms / 1000), 1) * 2
+    url = BASE_URL.replace("http", "ws", 1) + "/ws/live"
+    print(f"Replaying {file_path} ({len(y) / sample_rate:.1f}s) to {url}")
+
+    async def replay():
+        async with websockets.connect(url, max_size=None) as ws:
+            start = time.perf_counter()
+            await ws.send(json.dumps({"type": "start", "encoding": "pcm_s16le", "sample_rate": sample_rate,
+                                      "channels": 1, "transcript": transcript}))
+
+            async def send_audio():
+                for i, offset in enumerate(range(0, len(pcm), chunk_bytes)):
+                    if speed > 0:
+                        # Chunk i is due once its audio would have been spoken
+                        delay = i * chunk_ms / 1000 / speed - (time.perf_counter() - start)
+                        if delay > 0:
+                            await asyncio.sleep(delay)
+                    await ws.send(pcm[offset:offset + chunk_bytes])
+                await ws.send(json.dumps({"type": "end"}))
+
+            sender = asyncio.ensure_future(send_audio())
+            try:
+                async for raw in ws:
+                    message = json.loads(raw)
+                    elapsed = time.perf_counter() - start
+                    if message["type"] == "progress":
+                        print(f"[{elapsed:6.1f}s] heard {message['seconds']:.1f}s, match ratio {message['match_ratio']:.1%}")
+                    elif message["type"] == "window":
+                        print(f"[{elapsed:6.1f}s] window {message['start']:.1f}-{message['end']:.1f}s: "
+                              f"{message['label']} ({message['confidence']:.3f})")
+                    elif message["type"] == "verdict":
+                        print(f"[{elapsed:6.1f}s] VERDICT after {message['seconds']:.1f}s of audio: "
+                              f"{message['label']} via {message['stage']} - {message.get('details')}")
+                    elif message["type"] == "final":
+                        print(f"[{elapsed:6.1f}s] final: {message['label']}")
+                    else:
+                        print(f"[{elapsed:6.1f}s] {message}")
+            finally:
+                sender.cancel()
+
+    asyncio.run(replay())
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Diagnostics tool for Nemo.")
@@ -182,6 +760,68 @@ if __name__ == "__main__":
     parser_acc = subparsers.add_parser("accuracy", help="Run batch accuracy test")
     parser_acc.add_argument("--limit", type=int, default=20, help="Number of files per category")
 
+    # Peak Picking Benchmark
+    parser_peaks = subparsers.add_parser("bench-peaks", help="Benchmark peak picking strategies (speed and recall)")
+    parser_peaks.add_argument("--strategies", nargs="+", default=["diamond", "separable", "topk", "numba"], help="Strategies to compare")
+    parser_peaks.add_argument("--limit", type=int, default=50, help="Number of corpus files to sample")
+    parser_peaks.add_argument("--excerpt", type=float, default=5.0, help="Query excerpt length in seconds")
+    parser_peaks.add_argument("--snr", type=float, default=20.0, help="Signal-to-noise ratio of the query excerpts (dB)")
+
+    # Spectral Front End Check
+    parser_frontend = subparsers.add_parser("check-frontend", help="Check the shared STFT front end against the separate pipelines")
+    parser_frontend.add_argument("--limit", type=int, default=20, help="Number of corpus files to sample")
+    parser_frontend.add_argument("--tolerance", type=float, default=1e-3, help="Maximum allowed log-mel difference (dB)")
+
+    # Streaming Parity Check
+    parser_stream = subparsers.add_parser("check-stream", help="Check streamed fingerprints against full-file fingerprints")
+    parser_stream.add_argument("--limit", type=int, default=20, help="Number of corpus files to sample")
+    parser_stream.add_argument("--runs", type=int, default=2, help="Streaming runs per file (results must be identical)")
+    parser_stream.add_argument("--min-overlap", type=float, default=0.99, help="Minimum share of hashes in common")
+
+    # Legacy DB Check
+    parser_legacy = subparsers.add_parser("check-legacy-db", help="Check migration of a DB written by the original build tool")
+    parser_legacy.add_argument("--limit", type=int, default=5, help="Number of corpus files to write")
+
+    # Compressed Upload Check
+    parser_decode = subparsers.add_parser("check-decode", help="Check m4a decoding through the librosa/audioread fallback")
+    parser_decode.add_argument("--file", default=None, help="m4a/aac/webm file to decode (default: encode a corpus excerpt with ffmpeg)")
+    parser_decode.add_argument("--seconds", type=float, default=10.0, help="Length of the encoded excerpt")
+
+    # Cold Start Benchmark
+    parser_cold = subparsers.add_parser("bench-coldstart", help="Seconds from process start to the first fingerprint / hybrid response")
+    parser_cold.add_argument("--file", default=None, help="Audio file to send (default: first corpus file)")
+    parser_cold.add_argument("--port", type=int, default=8012, help="Port for the temporary server")
+    parser_cold.add_argument("--timeout", type=float, default=300.0, help="Give up after this many seconds")
+
+    # Inference Batching Benchmark
+    parser_batch = subparsers.add_parser("bench-batching", help="Benchmark hybrid model throughput through the inference batcher by batch size")
+    parser_batch.add_argument("--batch-sizes", type=int, nargs="+", default=[4, 8, 16, 32], help="Batch sizes to compare with 1")
+    parser_batch.add_argument("--requests", dest="n_requests", type=int, default=64, help="Concurrent requests per batch size")
+    parser_batch.add_argument("--max-wait-ms", type=float, default=10.0, help="Batcher wait after the first queued request")
+    parser_batch.add_argument("--model", default=None, help="Path to the .keras model")
+
+    # Match Session Benchmark
+    parser_match = subparsers.add_parser("bench-match", help="Benchmark chunked vs. one-shot match voting on long unmatched queries")
+    parser_match.add_argument("--index", default=os.path.join(BASE_DIR, 'fingerprints.idx'), help="Index file to query (falls back to --db)")
+    parser_match.add_argument("--db", default=os.path.join(BASE_DIR, 'fingerprints.db'), help="Fingerprint DB to load when there is no index file")
+    parser_match.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 400000], help="Query sizes (hashes)")
+    parser_match.add_argument("--repeat", type=int, default=3, help="Runs per size (median is reported)")
+    parser_match.add_argument("--max-ratio", type=float, default=5.0, help="Fail when chunked voting is slower than this multiple of one-shot")
+
+    # SQL Lookup Benchmark
+    parser_sql = subparsers.add_parser("bench-sql-lookup", help="Benchmark chunked IN-list vs. set-based SQLite hash lookups")
+    parser_sql.add_argument("--db", default=os.path.join(BASE_DIR, 'fingerprints.db'), help="Fingerprint DB to query")
+    parser_sql.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000, 200000], help="Query sizes (hashes)")
+    parser_sql.add_argument("--repeat", type=int, default=3, help="Runs per size (median is reported)")
+
+    # Live Call Replay
+    parser_live = subparsers.add_parser("live-replay", help="Replay a recording to the /ws/live endpoint at real-time speed")
+    parser_live.add_argument("--file", default=None, help="Audio file to replay (default: a random Dataset/Data file)")
+    parser_live.add_argument("--sample-rate", type=int, default=16000, help="PCM sampling rate sent to the server")
+    parser_live.add_argument("--chunk-ms", type=int, default=100, help="Audio per WebSocket message (milliseconds)")
+    parser_live.add_argument("--speed", type=float, default=1.0, help="Replay speed (0: as fast as possible)")
+    parser_live.add_argument("--transcript", default=None, help="Use this transcript instead of transcribing the call")
+
     args = parser.parse_args()
 
     if args.command == "test-engine":
@@ -190,5 +830,25 @@ if __name__ == "__main__":
         test_api(args.file)
     elif args.command == "accuracy":
         test_accuracy(limit=args.limit)
+    elif args.command == "bench-peaks":
+        bench_peaks(args.strategies, limit=args.limit, excerpt_seconds=args.excerpt, snr_db=args.snr)
+    elif args.command == "check-frontend":
+        check_frontend(limit=args.limit, tolerance_db=args.tolerance)
+    elif args.command == "check-stream":
+        check_stream(limit=args.limit, runs=args.runs, min_overlap=args.min_overlap)
+    elif args.command == "check-legacy-db":
+        check_legacy_db(limit=args.limit)
+    elif args.command == "check-decode":
+        check_decode(args.file, seconds=args.seconds)
+    elif args.command == "bench-coldstart":
+        bench_coldstart(args.file, port=args.port, timeout=args.timeout)
+    elif args.command == "bench-batching":
+        bench_batching(args.batch_sizes, n_requests=args.n_requests, max_wait_ms=args.max_wait_ms, model_path=args.model)
+    elif args.command == "bench-match":
+        bench_match(args.index, args.db, args.sizes, repeat=args.repeat, max_ratio=args.max_ratio)
+    elif args.command == "bench-sql-lookup":
+        bench_sql_lookup(args.db, args.sizes, repeat=args.repeat)
+    elif args.command == "live-replay":
+        live_replay(args.file, sample_rate=args.sample_rate, chunk_ms=args.chunk_ms, speed=args.speed, transcript=args.transcript)
     else:
         parser.print_help()
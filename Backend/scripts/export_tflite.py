@@ -0,0 +1,217 @@
+import os
+os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+# Add parent directory to path to import the serving modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tflite_serving import TextTokenizer, TFLiteHybridModel
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATASET_DIR = os.path.join(BASE_DIR, 'Dataset')
+MODEL_PATH = os.path.join(DATASET_DIR, 'hybrid_audio_text_model_v6.keras')
+QUANTIZATIONS = ['float16', 'int8']
+
+def export_paths(model_path):
+    stem = os.path.splitext(model_path)[0]
+    return {
+        'float16': f"{stem}.float16.tflite",
+        'int8': f"{stem}.int8.tflite",
+        'tokenizer': f"{stem}.tokenizer.json",
+    }
+
+def rss_mb():
+    """Resident set size of this process in MB (Linux)."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return float('nan')
+
+# --- EXPORT ---
+def split_text_vectorization(model):
+    """
+    Rebuilds the hybrid model with the TextVectorization layer cut off: the text
+    input becomes the int token sequence it produced. Returns (model, vectorizer).
+    """
+    import tensorflow as tf
+
+    vectorizers = [layer for layer in model.layers if isinstance(layer, tf.keras.layers.TextVectorization)]
+    if len(vectorizers) != 1:
+        raise ValueError(f"Expected one TextVectorization layer, found {len(vectorizers)}")
+    vectorizer = vectorizers[0]
+    sequence_length = vectorizer.get_config()['output_sequence_length']
+    if not sequence_length:
+        raise ValueError("TextVectorization needs a fixed output_sequence_length to export")
+
+    # model.layers is in topological order and each layer is called once
+    tensors = {}
+    new_inputs = []
+    for layer in model.layers:
+        if isinstance(layer, tf.keras.layers.InputLayer):
+            if layer.dtype != tf.string:
+                tensors[layer.name] = tf.keras.Input(shape=layer.output.shape[1:], dtype=layer.dtype, name=layer.name)
+                new_inputs.append(tensors[layer.name])
+            continue
+        if layer is vectorizer:
+            tensors[layer.name] = tf.keras.Input(shape=(sequence_length,), dtype='int64', name='text_tokens')
+            new_inputs.append(tensors[layer.name])
+            continue
+        inbound = layer.inbound_nodes[0].inbound_layers
+        args = [tensors[l.name] for l in (inbound if isinstance(inbound, list) else [inbound])]
+        tensors[layer.name] = layer(args if len(args) > 1 else args[0])
+
+    stripped = tf.keras.Model(inputs=new_inputs, outputs=tensors[model.layers[-1].name])
+    return stripped, vectorizer
+
+def convert(model, quantization):
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS]
+    # Both are post-training: float16 weights, or int8 dynamic-range weights with float activations
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    return converter.convert()
+
+def export(model_path, quantizations):
+    import tensorflow as tf
+
+    print(f"Loading {model_path}...")
+    model = tf.keras.models.load_model(model_path)
+    stripped, vectorizer = split_text_vectorization(model)
+    paths = export_paths(model_path)
+
+    config = vectorizer.get_config()
+    tokenizer = TextTokenizer(vectorizer.get_vocabulary(), config['output_sequence_length'],
+                              config.get('standardize'), config.get('split', 'whitespace'))
+    tokenizer.save(paths['tokenizer'])
+    print(f"Saved tokenizer ({len(tokenizer.vocabulary)} tokens) to {paths['tokenizer']}")
+
+    # The NumPy tokenizer must reproduce the layer exactly
+    samples = ["Hello, this is your BANK calling!", "Please share the OTP: 123-456.", "", "ok  ok\tok"]
+    expected = vectorizer(tf.constant(samples)).numpy()
+    if not np.array_equal(expected, tokenizer(samples)):
+        raise ValueError("NumPy tokenizer does not match the TextVectorization layer")
+
+    for quantization in quantizations:
+        start = time.time()
+        flatbuffer = convert(stripped, quantization)
+        with open(paths[quantization], 'wb') as f:
+            f.write(flatbuffer)
+        print(f"Saved {quantization} model to {paths[quantization]} "
+              f"({len(flatbuffer) / 1e6:.1f} MB, {time.time() - start:.1f}s)")
+    print(f"Keras model: {os.path.getsize(model_path) / 1e6:.1f} MB")
+
+# --- COMPARISON ---
+def load_test_set(limit):
+    """The held-out split and preprocessing used by evaluate_model.py."""
+    import pandas as pd
+    from sklearn.model_selection import train_test_split
+    from evaluate_model import CSV_FILE_PATH, get_valid_audio_path, load_and_process_audio, process_text
+
+    df = pd.read_csv(CSV_FILE_PATH)
+    df['Category'] = df['Category'].replace('Legg_Call', 'Legit_Call')
+    df['audio_path'] = df.apply(get_valid_audio_path, axis=1)
+    df = df.dropna(subset=['audio_path'])
+    _, test_df = train_test_split(df, test_size=0.2, random_state=42, stratify=df['Label'])
+    if limit:
+        test_df = test_df.iloc[:limit]
+    audio = np.array([load_and_process_audio(path) for path in test_df['audio_path']], dtype='float32')
+    texts = [process_text(text) for text in test_df['Transcript_Text']]
+    labels = test_df['Label'].values.astype('float32')
+    return audio, texts, labels
+
+def run_backend(backend, model_path, inputs_path):
+    """Runs in a fresh process so load time and RSS are measured in isolation."""
+    data = np.load(inputs_path, allow_pickle=True)
+    audio, texts = data['audio'], list(data['texts'])
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    if backend == 'keras':
+        import tensorflow as tf
+        model = tf.keras.models.load_model(model_path)
+        predict = lambda a, t: model.predict([a, tf.reshape(tf.constant(t), [-1, 1])], verbose=0)[:, 0]
+    else:
+        paths = export_paths(model_path)
+        model = TFLiteHybridModel(paths[backend], paths['tokenizer'], batch_buckets=(1,))
+        predict = model.predict
+    load_seconds = time.perf_counter() - start
+
+    predict(audio[:1], texts[:1])  # warm-up
+    latencies = []
+    scores = []
+    for i in range(len(texts)):
+        start = time.perf_counter()
+        scores.append(float(predict(audio[i:i + 1], texts[i:i + 1])[0]))
+        latencies.append(time.perf_counter() - start)
+    return {
+        'load_seconds': load_seconds,
+        'rss_mb': rss_mb(),
+        'rss_delta_mb': rss_mb() - rss_before,
+        'latency_p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'latency_p95_ms': float(np.percentile(latencies, 95) * 1000),
+        'scores': scores,
+    }
+
+def compare(model_path, backends, limit):
+    print("Preparing the evaluate_model.py test split...")
+    audio, texts, labels = load_test_set(limit)
+    print(f"{len(texts)} test samples")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        inputs_path = os.path.join(tmp, 'inputs.npz')
+        np.savez(inputs_path, audio=audio, texts=np.array(texts, dtype=object))
+        for backend in backends:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--worker', backend, '--model', model_path, '--inputs', inputs_path],
+                capture_output=True, text=True)
+            if output.returncode != 0:
+                print(f"{backend}: failed\n{output.stderr[-2000:]}")
+                continue
+            results[backend] = json.loads(output.stdout.strip().splitlines()[-1])
+
+    if 'keras' not in results:
+        print("Keras reference did not run; cannot check parity.")
+        return
+    reference = np.array(results['keras']['scores'])
+    print(f"\n{'backend':<10}{'accuracy':>10}{'agree':>8}{'max |d|':>10}{'load (s)':>10}{'RSS (MB)':>10}{'p50 (ms)':>10}{'p95 (ms)':>10}")
+    for backend, r in results.items():
+        scores = np.array(r['scores'])
+        accuracy = np.mean((scores > 0.5) == (labels > 0.5))
+        agree = np.mean((scores > 0.5) == (reference > 0.5))
+        print(f"{backend:<10}{accuracy:>10.2%}{agree:>8.1%}{np.max(np.abs(scores - reference)):>10.4f}"
+              f"{r['load_seconds']:>10.2f}{r['rss_mb']:>10.0f}{r['latency_p50_ms']:>10.1f}{r['latency_p95_ms']:>10.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the hybrid model to TFLite and compare it with the Keras model.")
+    parser.add_argument('--model', default=MODEL_PATH, help='Path to the .keras model.')
+    parser.add_argument('--export', action='store_true', help='Write float16 / int8 TFLite models and the tokenizer next to the Keras model.')
+    parser.add_argument('--quantize', nargs='+', choices=QUANTIZATIONS, default=QUANTIZATIONS, help='Quantizations to export.')
+    parser.add_argument('--compare', action='store_true', help='Accuracy parity, latency and RSS of each backend on the evaluate_model.py test split.')
+    parser.add_argument('--limit', type=int, default=None, help='Number of test samples used by --compare.')
+    parser.add_argument('--worker', choices=['keras'] + QUANTIZATIONS, help=argparse.SUPPRESS)
+    parser.add_argument('--inputs', help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_backend(args.worker, args.model, args.inputs)))
+    elif args.export or args.compare:
+        if args.export:
+            export(args.model, args.quantize)
+        if args.compare:
+            compare(args.model, ['keras'] + args.quantize, args.limit)
+    else:
+        parser.print_help()
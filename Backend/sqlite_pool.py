@@ -0,0 +1,165 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Read-side SQLite tuning. Connections are opened read-only (mode=ro, query_only) and
+# kept open, so the page cache and prepared statements survive between requests.
+CACHE_SIZE_KB = 64 * 1024         # page cache per connection
+MMAP_SIZE = 256 * 1024 * 1024     # bytes of the DB file read through mmap instead of read()
+CACHED_STATEMENTS = 256           # prepared statements kept per connection
+HEALTH_CHECK_SECONDS = 30.0       # idle time after which a connection is checked before reuse
+
+def connect_readonly(db_path: str, cache_size_kb: int = CACHE_SIZE_KB, mmap_size: int = MMAP_SIZE,
+                     cached_statements: int = CACHED_STATEMENTS) -> sqlite3.Connection:
+    """A tuned read-only connection; raises sqlite3.OperationalError if the DB does not exist."""
+    uri = f"file:{os.path.abspath(db_path)}?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False, cached_statements=cached_statements)
+    conn.execute("PRAGMA query_only = ON")
+    conn.execute(f"PRAGMA cache_size = {-int(cache_size_kb)}")
+    conn.execute(f"PRAGMA mmap_size = {int(mmap_size)}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+class _PooledConnection:
+    def __init__(self, conn: sqlite3.Connection, identity):
+        self.conn = conn
+        self.identity = identity
+        self.last_used = time.monotonic()
+
+class ConnectionPool:
+    """
+    Queue-based pool of read-only connections to one SQLite file.
+    Up to `size` connections are opened on demand and reused afterwards. Before
+    a connection is handed out it is health-checked (SELECT 1) when it has been
+    idle for health_check_seconds, and replaced when the DB file was swapped
+    since it was opened (e.g. by a rebuild). A connection that raises during use
+    is discarded rather than returned to the pool.
+    """
+
+    def __init__(self, db_path: str, size: int = 4, timeout: float = 30.0,
+                 health_check_seconds: float = HEALTH_CHECK_SECONDS, **connect_options):
+        self.db_path = db_path
+        self.size = max(int(size), 1)
+        self.timeout = timeout
+        self.health_check_seconds = health_check_seconds
+        self.connect_options = connect_options
+        self._idle = queue.LifoQueue()  # most recently used first: its pages are warmest
+        self._lock = threading.Lock()
+        self._open_count = 0
+        self._closed = False
+        self.stats = {'opened': 0, 'checkouts': 0, 'reused': 0, 'health_checks': 0, 'health_failures': 0,
+                      'recycled': 0, 'discarded': 0, 'waits': 0, 'wait_seconds': 0.0}
+
+    def _file_identity(self):
+        try:
+            st = os.stat(self.db_path)
+        except OSError:
+            return None
+        return st.st_dev, st.st_ino
+
+    def _open(self) -> _PooledConnection:
+        conn = connect_readonly(self.db_path, **self.connect_options)
+        with self._lock:
+            self.stats['opened'] += 1
+        return _PooledConnection(conn, self._file_identity())
+
+    def _close(self, pooled: _PooledConnection) -> None:
+        with self._lock:
+            self._open_count -= 1
+        try:
+            pooled.conn.close()
+        except sqlite3.Error:
+            pass
+
+    def _healthy(self, pooled: _PooledConnection) -> bool:
+        if pooled.identity != self._file_identity():
+            with self._lock:
+                self.stats['recycled'] += 1
+            return False
+        if time.monotonic() - pooled.last_used < self.health_check_seconds:
+            return True
+        with self._lock:
+            self.stats['health_checks'] += 1
+        try:
+            pooled.conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            with self._lock:
+                self.stats['health_failures'] += 1
+            return False
+
+    def _acquire(self) -> _PooledConnection:
+        while True:
+            try:
+                pooled = self._idle.get_nowait()
+            except queue.Empty:
+                with self._lock:
+                    can_open = self._open_count < self.size
+                    if can_open:
+                        self._open_count += 1
+                if can_open:
+                    try:
+                        return self._open()
+                    except Exception:
+                        with self._lock:
+                            self._open_count -= 1
+                        raise
+                start = time.monotonic()
+                try:
+                    pooled = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise TimeoutError(f"No SQLite connection available within {self.timeout} seconds")
+                with self._lock:
+                    self.stats['waits'] += 1
+                    self.stats['wait_seconds'] += time.monotonic() - start
+
+            if self._healthy(pooled):
+                with self._lock:
+                    self.stats['reused'] += 1
+                return pooled
+            self._close(pooled)
+
+    @contextmanager
+    def connection(self):
+        """Checks out a connection for the duration of the with block."""
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        pooled = self._acquire()
+        with self._lock:
+            self.stats['checkouts'] += 1
+        try:
+            yield pooled.conn
+        except BaseException:
+            # The connection may be mid-statement or broken; a fresh one is cheaper than doubt
+            with self._lock:
+                self.stats['discarded'] += 1
+            self._close(pooled)
+            raise
+        pooled.last_used = time.monotonic()
+        if self._closed:
+            self._close(pooled)
+        else:
+            self._idle.put(pooled)
+
+    def close(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                self._close(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+    def info(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+            open_count = self._open_count
+        return {
+            **stats,
+            'reuse_rate': stats['reused'] / stats['checkouts'] if stats['checkouts'] else 0.0,
+            'open': open_count,
+            'idle': self._idle.qsize(),
+            'size': self.size,
+        }
@@ -0,0 +1,144 @@
+import json
+import re
+import threading
+import time
+import numpy as np
+
+# TFLite inference backend for the hybrid model (see scripts/export_tflite.py).
+# The TextVectorization front end cannot be expressed in TFLite builtin ops, so it is
+# exported alongside the model as a vocabulary and tokenized here in NumPy. Serving
+# then needs only a TFLite interpreter, not the TensorFlow runtime.
+
+# keras TextVectorization defaults ('lower_and_strip_punctuation', 'whitespace')
+STRIP_PUNCTUATION = re.compile(r'[!"#$%&()\*\+,-\./:;<=>?@\[\\\]^_`{|}~\']')
+ASCII_LOWER = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+
+def load_interpreter(model_path: str, num_threads=None):
+    """The lightest available TFLite interpreter: LiteRT, tflite_runtime, then full TensorFlow."""
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+    return Interpreter(model_path=model_path, num_threads=num_threads)
+
+class TextTokenizer:
+    """NumPy equivalent of the model's TextVectorization layer (output_mode='int')."""
+
+    def __init__(self, vocabulary, sequence_length: int, standardize: str = 'lower_and_strip_punctuation', split: str = 'whitespace'):
+        if standardize not in ('lower_and_strip_punctuation', 'lower', None) or split != 'whitespace':
+            raise ValueError(f"Unsupported TextVectorization config: standardize={standardize}, split={split}")
+        self.vocabulary = list(vocabulary)
+        self.sequence_length = sequence_length
+        self.standardize = standardize
+        # Index 0 is padding, 1 the OOV token
+        self._index = {token: i for i, token in enumerate(self.vocabulary) if i > 1}
+
+    @classmethod
+    def load(cls, path: str) -> 'TextTokenizer':
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        return cls(config['vocabulary'], config['sequence_length'], config.get('standardize'), config.get('split', 'whitespace'))
+
+    def save(self, path: str) -> None:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'vocabulary': self.vocabulary, 'sequence_length': self.sequence_length,
+                       'standardize': self.standardize, 'split': 'whitespace'}, f, ensure_ascii=False)
+
+    def __call__(self, texts) -> np.ndarray:
+        tokens = np.zeros((len(texts), self.sequence_length), dtype=np.int64)
+        for row, text in enumerate(texts):
+            if self.standardize:
+                # tf.strings.lower only lowers ASCII
+                text = text.translate(ASCII_LOWER)
+            if self.standardize == 'lower_and_strip_punctuation':
+                text = STRIP_PUNCTUATION.sub('', text)
+            ids = [self._index.get(word, 1) for word in text.split()][:self.sequence_length]
+            tokens[row, :len(ids)] = ids
+        return tokens
+
+class TFLiteHybridModel:
+    """
+    Serves an exported TFLite hybrid model. Same interface as
+    model_serving.HybridModelServer: predict(), warmup(), ready and info().
+    """
+
+    def __init__(self, model_path: str, tokenizer_path: str, batch_buckets=(1, 2, 4, 8, 16), num_threads=None):
+        self.model_path = model_path
+        self.tokenizer = TextTokenizer.load(tokenizer_path)
+        self.interpreter = load_interpreter(model_path, num_threads)
+        self.batch_buckets = tuple(sorted(batch_buckets))
+        self.ready = False
+        self.warmup_seconds = {}
+        self.error = None
+        self._lock = threading.Lock()
+        self._batch_size = None
+
+        inputs = self.interpreter.get_input_details()
+        # Input order is not preserved by the converter; tell them apart by dtype
+        self._audio = next(d for d in inputs if d['dtype'] == np.float32)
+        self._tokens = next(d for d in inputs if d['dtype'] != np.float32)
+        self.audio_shape = tuple(int(n) for n in self._audio['shape'][1:])
+        self._output = self.interpreter.get_output_details()[0]
+
+    def _resize(self, batch_size: int) -> None:
+        if batch_size == self._batch_size:
+            return
+        self.interpreter.resize_tensor_input(self._audio['index'], (batch_size,) + self.audio_shape)
+        self.interpreter.resize_tensor_input(self._tokens['index'], (batch_size, self.tokenizer.sequence_length))
+        self.interpreter.allocate_tensors()
+        self._batch_size = batch_size
+
+    def _bucket(self, n: int) -> int:
+        for size in self.batch_buckets:
+            if size >= n:
+                return size
+        return self.batch_buckets[-1]
+
+    def _run(self, audio_batch: np.ndarray, transcripts) -> np.ndarray:
+        n = len(transcripts)
+        size = self._bucket(n)
+        audio = np.zeros((size,) + self.audio_shape, dtype=np.float32)
+        audio[:n] = audio_batch
+        tokens = self.tokenizer(list(transcripts) + [""] * (size - n)).astype(self._tokens['dtype'])
+        with self._lock:
+            self._resize(size)
+            self.interpreter.set_tensor(self._audio['index'], audio)
+            self.interpreter.set_tensor(self._tokens['index'], tokens)
+            self.interpreter.invoke()
+            output = self.interpreter.get_tensor(self._output['index'])
+        return output[:n, 0].copy()
+
+    def predict(self, audio_batch: np.ndarray, transcripts) -> np.ndarray:
+        """Scores a batch of (n, *audio_shape) mel inputs with their transcripts."""
+        largest = self.batch_buckets[-1]
+        scores = [self._run(audio_batch[start:start + largest], transcripts[start:start + largest])
+                  for start in range(0, len(transcripts), largest)]
+        return np.concatenate(scores) if scores else np.empty(0, dtype=np.float32)
+
+    def warmup(self) -> None:
+        try:
+            for size in self.batch_buckets:
+                start = time.perf_counter()
+                self._run(np.zeros((size,) + self.audio_shape, dtype=np.float32), ["warm up"] * size)
+                self.warmup_seconds[size] = round(time.perf_counter() - start, 4)
+        except Exception as e:
+            self.error = str(e)
+            print(f"WARNING: TFLite model warm-up failed: {e}")
+            return
+        self.ready = True
+        print(f"TFLite model warmed up for batch sizes {list(self.batch_buckets)} "
+              f"in {sum(self.warmup_seconds.values()):.2f} seconds.")
+
+    def info(self) -> dict:
+        return {
+            'ready': self.ready,
+            'backend': 'tflite',
+            'model': self.model_path,
+            'batch_buckets': list(self.batch_buckets),
+            'warmup_seconds': self.warmup_seconds,
+            'error': self.error,
+        }